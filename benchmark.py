@@ -0,0 +1,220 @@
+"""
+Benchmark suite for the image_core pipeline.
+
+Generates synthetic images locally (no downloads), times the hot paths and
+prints a JSON report: per case latency percentiles, throughput (images/s,
+MP/s) and peak RSS (Linux only: the high-water mark is reset before every
+case; pool cases report the largest worker). A saved report can be used as
+a baseline:
+
+    python benchmark.py --output base.json
+    python benchmark.py --baseline base.json          # exit 1 on regressions
+    python benchmark.py --quick                       # small sizes, few repeats
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from PIL import Image, ImageDraw
+
+from image_core import DEFAULT_SETTINGS, ImageProcessor
+
+RESOLUTIONS = {"1mp": (1280, 800), "12mp": (4000, 3000), "24mp": (6000, 4000)}
+FORMATS = {"jpg": "JPEG", "png": "PNG", "webp": "WEBP"}
+
+def reset_peak_rss():
+    """Restarts this process's VmHWM at its current RSS (Linux). False where that isn't possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb():
+    """VmHWM since the last reset_peak_rss(). ru_maxrss can't be reset, so there is no fallback."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"): return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def make_image(size, seed=0):
+    """Gradient + shapes + noise, so encoders see realistic, compressible content."""
+    w, h = size
+    img = Image.merge("RGB", [
+        Image.linear_gradient("L").resize(size),
+        Image.radial_gradient("L").resize(size),
+        Image.effect_noise(size, 40 + seed % 20)
+    ])
+    draw = ImageDraw.Draw(img)
+    for i in range(12):
+        x, y = (i * 7919 + seed * 104729) % w, (i * 6007 + seed * 7727) % h
+        draw.ellipse((x, y, x + w // 8, y + h // 8), fill=((i * 40) % 256, 120, 200))
+    return img
+
+def make_logo(path):
+    logo = Image.new("RGBA", (600, 200), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(logo)
+    draw.rounded_rectangle((0, 0, 599, 199), radius=40, fill=(255, 255, 255, 200))
+    draw.text((40, 80), "IMAGE STUDIO", fill=(20, 20, 20, 255))
+    logo.save(path)
+
+def time_case(fn, repeats):
+    """Returns (times, peak RSS in MB during the case or None)."""
+    reset = reset_peak_rss()
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times, peak_rss_mb() if reset else None
+
+def summarize(name, measured, images_per_call=1, pixels_per_call=0):
+    times, peak = measured
+    total = sum(times)
+    ordered = sorted(times)
+    pct = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "case": name,
+        "repeats": len(times),
+        "mean_s": statistics.mean(times),
+        "p50_s": pct(0.50),
+        "p90_s": pct(0.90),
+        "p99_s": pct(0.99),
+        "images_per_s": images_per_call * len(times) / total if total else None,
+        "mp_per_s": pixels_per_call * len(times) / total / 1e6 if total and pixels_per_call else None,
+        "peak_rss_mb": peak
+    }
+
+def pipeline_settings(wm_path):
+    """Every on/off combination of watermark and resize (down / up)."""
+    combos = []
+    for wm, resize in itertools.product([False, "center", "tile"], [None, 50, 150]):
+        settings = dict(DEFAULT_SETTINGS)
+        label = []
+        if wm:
+            settings.update(wm_enabled=True, wm_path=wm_path, wm_pos=wm,
+                            wm_scale=0.3 if wm == "center" else 0.08)
+            label.append(f"wm-{wm}")
+        if resize:
+            settings.update(resize_enabled=True, resize_scale=resize)
+            label.append(f"resize-{resize}")
+        combos.append(("+".join(label) or "noop", settings))
+    return combos
+
+def run_suite(resolutions, formats, repeats, batch, workers):
+    processor = ImageProcessor(track_history=False, thumb_db=None)
+    # Pool workers report their own peak RSS through the run metrics (fresh processes every run)
+    pool_processor = ImageProcessor(track_history=False, thumb_db=None, instrument=True)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        logo = os.path.join(tmp, "logo.png")
+        make_logo(logo)
+
+        for res_name in resolutions:
+            size = RESOLUTIONS[res_name]
+            pixels = size[0] * size[1]
+            for ext in formats:
+                src_dir = os.path.join(tmp, f"{res_name}_{ext}")
+                os.makedirs(src_dir)
+                paths = []
+                for i in range(batch):
+                    path = os.path.join(src_dir, f"img_{i}.{ext}")
+                    make_image(size, i).save(path, FORMATS[ext], quality=90)
+                    paths.append(path)
+                first = paths[0]
+                tag = f"{res_name}/{ext}"
+
+                results.append(summarize(f"load_image/{tag}",
+                    time_case(lambda: processor.load_image(first, use_cache=False).load(), repeats), 1, pixels))
+                results.append(summarize(f"get_thumbnail/{tag}",
+                    time_case(lambda: processor.get_thumbnail(first), repeats), 1, pixels))
+                results.append(summarize(f"get_preview/{tag}",
+                    # Cold: previews of paths are cached in image_cache
+                    time_case(lambda: (processor.image_cache.clear(), processor.get_preview(first, (900, 700))), repeats), 1, pixels))
+
+                # Pipeline on an already decoded frame (decode is measured above)
+                if ext == "jpg":
+                    base = processor.load_image(first, use_cache=False)
+                    base.load()
+                    for label, settings in pipeline_settings(logo):
+                        results.append(summarize(f"process_pipeline/{label}/{res_name}",
+                            time_case(lambda: processor.process_pipeline(base, settings), repeats), 1, pixels))
+
+                # End to end, sequential and on the process pool
+                export_settings = dict(DEFAULT_SETTINGS, wm_enabled=True, wm_path=logo,
+                                       resize_enabled=True, resize_scale=50, format="JPG")
+                for n_workers in sorted({1, workers}):
+                    out_dir = os.path.join(tmp, f"out_{res_name}_{ext}_{n_workers}")
+                    os.makedirs(out_dir)
+                    runner = processor if n_workers == 1 else pool_processor
+                    times, peak = time_case(lambda: runner.run_full_export(paths, out_dir, export_settings, workers=n_workers), 1)
+                    if n_workers > 1: peak = runner.last_run_metrics["peak_rss_mb"]
+                    results.append(summarize(f"run_full_export/w{n_workers}/{tag}", (times, peak), batch, batch * pixels))
+    return results
+
+def compare(results, baseline, threshold):
+    """Cases whose mean got slower than baseline by more than threshold (fraction)."""
+    base = {r["case"]: r for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = base.get(r["case"])
+        if not old or not old["mean_s"]: continue
+        change = (r["mean_s"] - old["mean_s"]) / old["mean_s"]
+        r["vs_baseline"] = change
+        if change > threshold: regressions.append((r["case"], old["mean_s"], r["mean_s"], change))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the image_core pipeline")
+    parser.add_argument("--resolutions", default="1mp,12mp,24mp", help=f"Comma list of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--formats", default="jpg,png,webp", help=f"Comma list of {', '.join(FORMATS)}")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=8, help="Images per end-to-end export")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--quick", action="store_true", help="1mp jpg only, 2 repeats")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="Compare against a saved report")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown vs baseline")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.resolutions, args.formats, args.repeats, args.batch = "1mp", "jpg", 2, 4
+
+    results = run_suite(args.resolutions.split(","), args.formats.split(","), args.repeats, args.batch, args.workers)
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "pillow": Image.__version__},
+        "results": results
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        report["regressions"] = [
+            {"case": c, "baseline_s": b, "current_s": n, "change": ch} for c, b, n, ch in regressions
+        ]
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    for case, old, new, change in regressions:
+        print(f"REGRESSION {case}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms (+{change:.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
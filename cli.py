@@ -0,0 +1,209 @@
+"""
+Headless batch runner for the Image Studio pipeline.
+
+Uses the same settings dict as the GUI (from flags and/or a JSON preset)
+and never imports customtkinter, so it runs on servers, in cron and in
+minimal containers.
+
+    python cli.py photos/ "raw/*.jpg" -o out --watermark logo.png --resize 50 --format WEBP
+    python cli.py photos/ -o out --preset web.json --workers 8
+    python cli.py incoming/ -o out --preset web.json --watch
+    python cli.py photos/ -o /shared/out --queue /shared/queue.db   # + "python work_queue.py /shared/queue.db" per node
+    python cli.py photos/ -o out --derivative scale=100 --derivative scale=50,format=webp --derivative max_size=256
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from image_core import DEFAULT_SETTINGS, IMAGE_EXTENSIONS, ImageProcessor, iter_image_files
+
+def expand_inputs(patterns, recursive=False):
+    """Expands files, directories and glob patterns into a de-duplicated list of image paths."""
+    files, seen = [], set()
+
+    def add(path):
+        path = os.path.abspath(path)
+        if path not in seen and path.lower().endswith(IMAGE_EXTENSIONS):
+            seen.add(path)
+            files.append(path)
+
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            if os.path.isdir(match):
+                for path in iter_image_files(match, recursive): add(path)
+            elif os.path.isfile(match):
+                add(match)
+    return files
+
+def parse_derivative(text):
+    """'scale=50,format=webp,quality=80' -> derivative spec dict (see image_core.DEFAULT_SETTINGS)."""
+    spec = {}
+    for part in text.split(","):
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key in ("scale", "max_size", "quality", "max_kb"): spec[key] = float(value) if key == "scale" else int(value)
+        elif key in ("format", "encoder"): spec[key] = value.strip().upper() if key == "format" else value.strip()
+        elif key in ("label", "pattern"): spec[key] = value
+        else: raise argparse.ArgumentTypeError(f"unknown derivative key: {key!r}")
+    # Short CLI names -> settings keys
+    if "encoder" in spec: spec["encoder_preset"] = spec.pop("encoder")
+    if "max_kb" in spec: spec["max_bytes"] = spec.pop("max_kb") * 1024
+    return spec
+
+def build_settings(args):
+    settings = dict(DEFAULT_SETTINGS)
+    if args.preset:
+        with open(args.preset, 'r') as f:
+            settings.update(json.load(f))
+        # Presets may spell formats in any case ("jpg"); the pipeline compares upper-case names
+        for target in [settings] + list(settings.get('derivatives') or []):
+            if target.get('format'): target['format'] = target['format'].upper()
+
+    # Flags override the preset
+    if args.watermark:
+        settings['wm_path'] = args.watermark
+        settings['wm_enabled'] = True
+    if args.no_watermark: settings['wm_enabled'] = False
+    for key, value in (('wm_pos', args.wm_pos), ('wm_x', args.wm_x), ('wm_y', args.wm_y),
+                       ('wm_opacity', args.wm_opacity), ('wm_scale', args.wm_scale),
+                       ('wm_tile_gap', args.wm_tile_gap)):
+        if value is not None: settings[key] = value
+    if args.resize is not None:
+        settings['resize_scale'] = args.resize
+        settings['resize_enabled'] = args.resize != 100
+    if args.format: settings['format'] = args.format.upper()
+    if args.encoder: settings['encoder_preset'] = args.encoder
+    if args.quality is not None: settings['quality'] = args.quality
+    if args.max_kb is not None: settings['max_bytes'] = args.max_kb * 1024 if args.max_kb > 0 else None
+    if args.derivative: settings['derivatives'] = args.derivative
+    return settings
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Image Studio Pro headless batch export")
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Descend into sub-directories")
+    parser.add_argument("--preset", help="JSON file with a settings dict")
+    parser.add_argument("--save-preset", help="Write the effective settings to this JSON file")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: all cores)")
+    parser.add_argument("--max-pixels", type=int, help="Allow inputs up to this many pixels (Pillow's bomb limit)")
+    parser.add_argument("--max-image-mb", type=int, default=2048, help="Per-image decoded memory ceiling")
+    parser.add_argument("--resume", action="store_true", help="Skip files already exported with the same settings")
+    parser.add_argument("--no-history", action="store_true", help="Don't record the run in the history store")
+    parser.add_argument("--dedupe", choices=["exact", "near"], help="Skip byte-identical copies (exact) or also look-alike images (near)")
+    parser.add_argument("--queue", metavar="DB", help="Distribute the files through this SQLite work queue (see work_queue.py)")
+    parser.add_argument("--local-workers", type=int, default=0, help="With --queue: also start N workers on this host")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and export new/changed files in the input directory (always resumes)")
+    parser.add_argument("--settle", type=float, default=2.0, help="Watch mode: seconds a file must stay unchanged before export")
+    parser.add_argument("--poll", type=float, default=1.0, help="Watch mode: seconds between checks")
+    parser.add_argument("--metrics", action="store_true", help="Print per-stage timings and counters as JSON")
+    parser.add_argument("-q", "--quiet", action="store_true")
+
+    wm = parser.add_argument_group("watermark")
+    wm.add_argument("--watermark", metavar="PNG", help="Logo file (enables the watermark)")
+    wm.add_argument("--no-watermark", action="store_true", help="Disable a watermark set by the preset")
+    wm.add_argument("--wm-pos", choices=["center", "top_left", "top_right", "bottom_left", "bottom_right", "tile", "manual"])
+    wm.add_argument("--wm-x", type=float, help="Manual X position (0-1)")
+    wm.add_argument("--wm-y", type=float, help="Manual Y position (0-1)")
+    wm.add_argument("--wm-opacity", type=float)
+    wm.add_argument("--wm-scale", type=float, help="Logo width as a fraction of the image width")
+    wm.add_argument("--wm-tile-gap", type=float, help="Spacing between tiled logos, as a fraction of the logo size")
+
+    out = parser.add_argument_group("output")
+    out.add_argument("--resize", type=float, metavar="PERCENT", help="Scale percentage (100 = off)")
+    out.add_argument("--format", choices=["JPG", "PNG", "WEBP", "ICO", "jpg", "png", "webp", "ico"])
+    out.add_argument("--encoder", choices=["fast", "balanced", "smallest"], help="Encoder speed/size preset")
+    out.add_argument("--quality", type=int, help="JPEG/WEBP quality (default 95)")
+    out.add_argument("--max-kb", type=int, help="Lower the quality until each file fits this size (0 = off)")
+    out.add_argument("--derivative", action="append", type=parse_derivative, metavar="SPEC",
+                     help="Extra output target, repeatable: scale=50,format=webp,quality=80 or "
+                          "max_size=256,label=thumb,encoder=smallest,max_kb=20 (replaces --resize/--format)")
+    return parser
+
+def watch(args, settings):
+    from hot_folder import HotFolder
+
+    if len(args.inputs) != 1 or not os.path.isdir(args.inputs[0]):
+        print("--watch needs exactly one input directory.", file=sys.stderr)
+        return 2
+    # Watch mode already skips files in the export journal, so --resume is implied
+    unsupported = [flag for flag, used in (("--dedupe", args.dedupe), ("--queue", args.queue),
+                                           ("--local-workers", args.local_workers)) if used]
+    if unsupported:
+        print(f"--watch can't be combined with {', '.join(unsupported)}.", file=sys.stderr)
+        return 2
+    processor = ImageProcessor(
+        track_history=not args.no_history, thumb_db=None,
+        max_image_bytes=args.max_image_mb * 1024 * 1024, max_image_pixels=args.max_pixels,
+        instrument=args.metrics
+    )
+
+    def report(files, exported):
+        if not args.quiet: print(f"{time.strftime('%H:%M:%S')}  exported {exported} of {len(files)} new/changed images", flush=True)
+        if args.metrics: print(json.dumps(processor.last_run_metrics, indent=2), flush=True)
+
+    folder = HotFolder(
+        processor, args.inputs[0], args.output, settings, recursive=args.recursive,
+        settle_seconds=args.settle, poll_interval=args.poll, workers=args.workers or 1, on_batch=report
+    )
+    if not args.quiet:
+        print(f"Watching {folder.input_dir} ({'file events' if folder.use_events else 'polling'}), Ctrl+C to stop")
+    try:
+        folder.run()
+    except KeyboardInterrupt:
+        folder.stop()
+    return 0
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    settings = build_settings(args)
+
+    if args.save_preset:
+        with open(args.save_preset, 'w') as f:
+            json.dump(settings, f, indent=4)
+
+    if args.watch: return watch(args, settings)
+
+    files = expand_inputs(args.inputs, args.recursive)
+    if not files:
+        print("No input images found.", file=sys.stderr)
+        return 2
+    os.makedirs(args.output, exist_ok=True)
+
+    processor = ImageProcessor(
+        track_history=not args.no_history, thumb_db=None,
+        max_image_bytes=args.max_image_mb * 1024 * 1024, max_image_pixels=args.max_pixels,
+        instrument=args.metrics
+    )
+    if args.dedupe:
+        from dedupe import find_duplicates
+        files, duplicates = find_duplicates(files, processor.get_thumbnail if args.dedupe == "near" else None)
+        if not args.quiet:
+            for path, (kind, original) in duplicates.items(): print(f"Skipping {path} ({kind} duplicate of {original})")
+
+    last = {'skipped': 0}
+    def report(status):
+        last.update(status)
+        if args.quiet: return
+        eta = f"{int(status['eta'])}s" if status['eta'] is not None else "?"
+        print(f"\r{status['files_done']}/{status['files_total']}  "
+              f"{status['files_per_sec']:.1f} img/s  ETA {eta}   ", end="", flush=True)
+
+    if args.queue:
+        from work_queue import SQLiteWorkQueue
+        count = processor.run_distributed_export(files, args.output, settings, SQLiteWorkQueue(args.queue),
+                                                 progress_cb=report, resume=args.resume, local_workers=args.local_workers)
+    else:
+        count = processor.run_full_export(files, args.output, settings, workers=args.workers, progress_cb=report, resume=args.resume)
+    skipped = last['skipped']
+    if not args.quiet: print(f"\nExported {count} of {len(files)} images to {args.output} ({skipped} already up to date)")
+    if args.metrics: print(json.dumps(processor.last_run_metrics, indent=2))
+    return 0 if count + skipped == len(files) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
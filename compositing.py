@@ -0,0 +1,68 @@
+"""
+Watermark compositing kernels.
+
+Blending stays on Pillow's C paths (masked paste / alpha_composite over the
+logo's box): PIL images can't be exposed to NumPy as writable buffers, so an
+array blend has to copy the region out and back and measured several times
+slower. NumPy is optional and only used where it wins, building tiled
+watermark layers with np.tile instead of thousands of pastes.
+"""
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+HAS_NUMPY = np is not None
+
+def apply_opacity(watermark, opacity):
+    """Scales the logo's alpha by opacity in one lookup-table pass."""
+    lut = [min(255, int(v * opacity + 0.5)) for v in range(256)]
+    watermark.putalpha(watermark.getchannel("A").point(lut))
+    return watermark
+
+def composite(img, overlay, x, y, in_place=False):
+    """
+    Blends overlay (RGBA) into img at (x, y), touching only its bounding box.
+    RGB and RGBA keep their mode (at most one copy, none when in_place);
+    other modes are converted to RGB first.
+    """
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    elif not in_place:
+        img = img.copy()
+
+    if img.mode == "RGB":
+        # Masked paste = alpha blend over the box; only the overlay is converted
+        img.paste(overlay, (x, y), overlay)
+        return img
+
+    # RGBA: proper alpha compositing of the visible part of the overlay
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + overlay.width, img.width), min(y + overlay.height, img.height)
+    if x1 > x0 and y1 > y0:
+        img.alpha_composite(overlay, dest=(x0, y0), source=(x0 - x, y0 - y, x1 - x, y1 - y))
+    return img
+
+def tile_layer(watermark, size, gap=0.5):
+    """
+    Full-frame RGBA layer with the logo repeated on a grid.
+    gap is the spacing between logos as a fraction of the logo size.
+    """
+    w, h = size
+    cell_w = watermark.width + int(watermark.width * gap)
+    cell_h = watermark.height + int(watermark.height * gap)
+    cell = Image.new("RGBA", (cell_w, cell_h))
+    cell.paste(watermark, ((cell_w - watermark.width) // 2, (cell_h - watermark.height) // 2))
+
+    if HAS_NUMPY:
+        reps = (h // cell_h + 1, w // cell_w + 1, 1)
+        arr = np.ascontiguousarray(np.tile(np.asarray(cell), reps)[:h, :w])
+        return Image.frombuffer("RGBA", (w, h), arr, "raw", "RGBA", 0, 1)
+
+    layer = Image.new("RGBA", (w, h))
+    for top in range(0, h, cell_h):
+        for left in range(0, w, cell_w):
+            layer.paste(cell, (left, top))
+    return layer
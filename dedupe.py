@@ -0,0 +1,174 @@
+"""
+Import-time duplicate detection.
+
+ImportIndex answers three questions as files come in, cheapest first:
+  - same path?            set lookup on the normalized path
+  - byte-identical file?  content hash, only computed when another file has
+                          exactly the same size (most imports never hash)
+  - same picture?         64-bit dHash of the thumbnail the import already
+                          makes, looked up in a BK-tree by Hamming distance
+Re-exports, resized copies and light recompression land within a few bits;
+unrelated photos are typically 20+ bits apart.
+"""
+import hashlib
+import os
+import threading
+
+from PIL import Image
+
+# Max differing dHash bits for two images to count as the same picture
+DEFAULT_NEAR_DISTANCE = 5
+
+def path_key(path):
+    return os.path.normcase(os.path.abspath(path))
+
+def content_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def dhash(img, hash_size=8):
+    """Difference hash: one bit per horizontally adjacent pixel pair of a tiny grayscale copy."""
+    small = img.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+class BKTree:
+    """Metric tree over Hamming distance: radius searches visit a small part of the tree."""
+    def __init__(self):
+        self.root = None  # [hash, item, {distance: child}]
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(value, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, item, {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """[(distance, item)] within max_distance, closest first."""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(value, node[0])
+            if d <= max_distance: found.append((d, node[1]))
+            # Triangle inequality: only children at distance d +/- max_distance can match
+            for child_d, child in node[2].items():
+                if d - max_distance <= child_d <= d + max_distance: stack.append(child)
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+class ImportIndex:
+    """
+    Thread-safe (import workers call it concurrently). add_file() is called
+    before the thumbnail is made, so exact duplicates never get decoded;
+    add_thumbnail() registers the perceptual hash and reports a near match.
+    """
+    def __init__(self, near_distance=DEFAULT_NEAR_DISTANCE):
+        self.near_distance = near_distance
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.paths = set()
+            self._by_size = {}     # size -> [path key]
+            self._sizes = {}       # path key -> size
+            self._digests = {}     # path key -> content hash (lazy)
+            self._tree = BKTree()
+            self._removed = set()  # BK-trees can't delete; removed paths are filtered from results
+
+    def has_path(self, path):
+        return path_key(path) in self.paths
+
+    def _digest(self, key):
+        with self._lock:
+            digest = self._digests.get(key)
+        if digest is None:
+            digest = content_hash(key)
+            with self._lock:
+                self._digests[key] = digest
+        return digest
+
+    def add_file(self, path):
+        """
+        Registers path. Returns (None, None) for a new file, ("path", path) when
+        it is already indexed or ("exact", original) for a byte-identical copy;
+        duplicates are not registered.
+        """
+        key = path_key(path)
+        size = os.path.getsize(key)
+        with self._lock:
+            if key in self.paths: return "path", key
+            self.paths.add(key)
+            self._removed.discard(key)
+            same_size = list(self._by_size.get(size, ()))
+            self._by_size.setdefault(size, []).append(key)
+            self._sizes[key] = size
+        if same_size:
+            digest = self._digest(key)
+            for other in same_size:
+                try:
+                    if self._digest(other) != digest: continue
+                except OSError:
+                    continue  # indexed file has since been deleted
+                self.remove(key)
+                return "exact", other
+        return None, None
+
+    def add_thumbnail(self, path, thumb):
+        """Adds thumb's dHash; returns the closest already-indexed near duplicate, or None."""
+        key = path_key(path)
+        value = dhash(thumb)
+        with self._lock:
+            matches = [item for _, item in self._tree.search(value, self.near_distance)
+                       if item not in self._removed and item != key]
+            self._tree.add(value, key)
+        return matches[0] if matches else None
+
+    def remove(self, path):
+        key = path_key(path)
+        with self._lock:
+            self.paths.discard(key)
+            self._digests.pop(key, None)
+            size = self._sizes.pop(key, None)
+            if size is not None: self._by_size[size].remove(key)
+            self._removed.add(key)
+
+def find_duplicates(paths, thumbnail_fn=None, near_distance=DEFAULT_NEAR_DISTANCE):
+    """
+    Batch version for headless runs: returns (unique_paths, {duplicate: (kind, original)}).
+    Near duplicates are only looked for when thumbnail_fn(path) -> PIL image is given.
+    """
+    index = ImportIndex(near_distance)
+    unique, duplicates = [], {}
+    for path in paths:
+        kind, original = index.add_file(path)
+        if kind is None and thumbnail_fn:
+            thumb = thumbnail_fn(path)
+            original = index.add_thumbnail(path, thumb) if thumb else None
+            if original:
+                kind = "near"
+                index.remove(path)  # skipped, so later files should match the original instead
+        if kind: duplicates[path] = (kind, original)
+        else: unique.append(path)
+    return unique, duplicates
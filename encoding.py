@@ -0,0 +1,76 @@
+"""
+Format-aware encoding.
+
+ENCODER_PRESETS maps every output format to "fast", "balanced" and
+"smallest" Pillow save parameters. "balanced" is Pillow's defaults (what
+exports always used), "fast" gives up file size for encode time and
+"smallest" the reverse. encode() works in memory and can search for the
+highest quality that fits a byte budget.
+"""
+import io
+
+PRESET_NAMES = ("fast", "balanced", "smallest")
+
+# Formats with a quality knob; the byte budget search only applies to these
+LOSSY_FORMATS = ("JPEG", "WEBP")
+
+ENCODER_PRESETS = {
+    # JPEG encode time barely moves with settings; optimize/progressive shave ~5-10% off the size
+    "JPEG": {"fast": {}, "balanced": {}, "smallest": {"optimize": True, "progressive": True}},
+    "PNG": {"fast": {"compress_level": 1}, "balanced": {"compress_level": 6}, "smallest": {"optimize": True}},
+    "WEBP": {"fast": {"method": 0}, "balanced": {"method": 4}, "smallest": {"method": 6}},
+    # Every ICO frame is encoded separately, so fewer/smaller frames is both faster and smaller
+    "ICO": {
+        "fast": {"sizes": [(16, 16), (32, 32), (48, 48), (64, 64)]},
+        "balanced": {"sizes": [(16, 16), (24, 24), (32, 32), (48, 48), (64, 64), (128, 128), (256, 256)]},
+        "smallest": {"sizes": [(16, 16), (32, 32)]},
+    },
+}
+
+def pillow_format(fmt):
+    fmt = (fmt or "JPG").upper()
+    return "JPEG" if fmt == "JPG" else fmt
+
+def save_params(img, fmt, preset="balanced", quality=95, **overrides):
+    """Pillow save() keyword arguments for fmt (a Pillow format name) at preset."""
+    if preset not in PRESET_NAMES: raise ValueError(f"Unknown encoder preset: {preset!r}")
+    params = dict(ENCODER_PRESETS.get(fmt, {}).get(preset, {}))
+    params.update(overrides)
+    if fmt in LOSSY_FORMATS: params["quality"] = quality
+    if fmt == "ICO":
+        # Pillow writes an empty icon when no frame fits inside the image
+        fits = [s for s in params.get("sizes", ()) if s[0] <= img.width and s[1] <= img.height]
+        params["sizes"] = fits or [(min(img.width, 256), min(img.height, 256))]
+    return params
+
+def _encode(img, fmt, params):
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, **params)
+    return buf.getvalue()
+
+def encode(img, fmt, preset="balanced", quality=95, max_bytes=None, min_quality=10, **overrides):
+    """
+    Encodes img to bytes. With max_bytes, lossy formats bisect for the highest
+    quality in [min_quality, quality] whose output fits (about log2(quality)
+    in-memory encodes); when even min_quality is too big, that smallest
+    attempt is returned. Lossless formats switch to the "smallest" preset.
+    Returns (data, quality_used).
+    """
+    fmt = pillow_format(fmt)
+    if max_bytes and fmt not in LOSSY_FORMATS: preset = "smallest"
+    data = _encode(img, fmt, save_params(img, fmt, preset, quality, **overrides))
+    if not max_bytes or fmt not in LOSSY_FORMATS or len(data) <= max_bytes: return data, quality
+
+    best, best_q, smallest = None, None, None
+    lo, hi = min_quality, quality - 1
+    while lo <= hi:
+        q = (lo + hi) // 2
+        candidate = _encode(img, fmt, save_params(img, fmt, preset, q, **overrides))
+        if len(candidate) <= max_bytes:
+            best, best_q, lo = candidate, q, q + 1
+        else:
+            if q == min_quality: smallest = candidate
+            hi = q - 1
+    if best is not None: return best, best_q
+    if smallest is None: smallest = _encode(img, fmt, save_params(img, fmt, preset, min_quality, **overrides))
+    return smallest, min_quality
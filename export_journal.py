@@ -0,0 +1,110 @@
+"""
+Per-file export records and resume support.
+
+Every export writes one row per source into <save_dir>/.isp_export.db:
+source, output, status, error, timings, the settings fingerprint and the
+source's mtime/size. With resume=True a source is skipped when a row with
+status "ok" exists for the same fingerprint and unchanged source, and the
+output file is still on disk.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JOURNAL_NAME = ".isp_export.db"
+
+def encode_outputs(output):
+    """Derivative exports produce a list of paths; it is stored as JSON (names may contain any separator)."""
+    return json.dumps(output) if isinstance(output, list) else output
+
+def decode_outputs(stored):
+    """Stored output -> list of paths ([] for none)."""
+    if not stored: return []
+    if stored.startswith("["):
+        try:
+            paths = json.loads(stored)
+            if isinstance(paths, list): return paths
+        except ValueError:
+            pass
+    return [stored]
+
+def settings_fingerprint(settings):
+    """Stable hash of the settings plus the watermark file's identity."""
+    data = dict(settings)
+    wm_path = settings.get('wm_path')
+    if settings.get('wm_enabled') and wm_path and os.path.exists(wm_path):
+        st = os.stat(wm_path)
+        data['_wm_file'] = (st.st_mtime, st.st_size)
+    blob = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()
+
+class ExportJournal:
+    """Rows are committed every commit_every records or commit_seconds, and on close()."""
+    def __init__(self, save_dir, settings, commit_every=50, commit_seconds=5.0):
+        self.fingerprint = settings_fingerprint(settings)
+        self.commit_every = commit_every
+        self.commit_seconds = commit_seconds
+        self._pending = 0
+        self._committed = time.monotonic()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(save_dir, JOURNAL_NAME), timeout=30, check_same_thread=False)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                source TEXT, fingerprint TEXT, output TEXT, status TEXT, error TEXT,
+                source_mtime REAL, source_size INTEGER, seconds REAL, finished REAL,
+                PRIMARY KEY (source, fingerprint)
+            )""")
+        self._db.commit()
+
+    def is_done(self, source):
+        try:
+            st = os.stat(source)
+        except OSError:
+            return False
+        with self._lock:
+            row = self._db.execute(
+                "SELECT output, source_mtime, source_size FROM files WHERE source=? AND fingerprint=? AND status='ok'",
+                (source, self.fingerprint)
+            ).fetchone()
+        return (bool(row) and row[1] == st.st_mtime and row[2] == st.st_size
+                and all(os.path.exists(p) for p in decode_outputs(row[0])))
+
+    def record(self, source, output, error=None, seconds=None):
+        """output: saved path, a list of paths (derivatives, see encode_outputs) or None."""
+        output = encode_outputs(output)
+        try:
+            st = os.stat(source)
+            mtime, size = st.st_mtime, st.st_size
+        except OSError:
+            mtime, size = None, None
+        status = "ok" if output else "error"
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (source, self.fingerprint, output, status, error, mtime, size, seconds, time.time())
+            )
+            self._pending += 1
+            now = time.monotonic()
+            if self._pending >= self.commit_every or now - self._committed >= self.commit_seconds:
+                self._db.commit()
+                self._pending = 0
+                self._committed = now
+
+    def results(self, status=None):
+        """Rows for this fingerprint as dicts (optionally filtered by status)."""
+        query = "SELECT source, output, status, error, seconds FROM files WHERE fingerprint=?"
+        args = [self.fingerprint]
+        if status:
+            query += " AND status=?"
+            args.append(status)
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [dict(zip(("source", "output", "status", "error", "seconds"), r)) for r in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.commit()
+            self._db.close()
@@ -0,0 +1,102 @@
+"""
+Streaming export pipeline: discover -> decode -> transform -> encode -> write.
+
+Each stage runs on its own thread and hands work to the next one through a
+bounded queue, so at most a few images are alive at any time no matter how
+many files (or how large a directory tree) are fed in. Pillow releases the
+GIL while decoding, resampling and encoding, so the stages also overlap.
+Sources can be a lazy iterator such as image_core.iter_image_files().
+"""
+import queue
+import threading
+import time
+
+_DONE = object()
+
+def _stage(fn, inbox, outbox):
+    """
+    Applies fn to each (path, payload, info) item. Failures travel on as
+    payload None with the message in info['error'].
+    """
+    while True:
+        item = inbox.get()
+        if item is _DONE:
+            outbox.put(_DONE)
+            return
+        path, payload, info = item
+        if payload is not None:
+            try:
+                payload = fn(path, payload)
+                if payload is None: info['error'] = "could not decode"
+            except Exception as e:
+                print(f"Error saving {path}: {e}")
+                info['error'] = str(e)
+                payload = None
+        outbox.put((path, payload, info))
+
+def stream_export(processor, sources, save_dir, settings, queue_depth=2, on_file_done=None, cancel_event=None,
+                  metrics=None):
+    """
+    Exports sources (any iterable of paths, may be lazy) through the pipeline.
+    Peak memory is bounded by queue_depth per stage, not by the number of files.
+    on_file_done(path, saved, error, seconds) is called from the calling thread.
+    saved is the output path, a list of paths with derivatives, or None.
+    metrics: where stages are recorded (default processor.metrics).
+    Returns the number of files written.
+    """
+    metrics = metrics or processor.metrics
+
+    def decode(path, _):
+        return processor.load_for_export(path, settings, metrics)
+
+    def transform(path, decoded):
+        img, src_size = decoded
+        return processor.render_outputs(img, settings, in_place=True, src_size=src_size, metrics=metrics)
+
+    def encode(path, outputs):
+        return [(spec, img.size, processor.encode_image(img, settings, spec, metrics)) for spec, img in outputs]
+
+    stages = (decode, transform, encode)
+    queues = [queue.Queue(maxsize=queue_depth) for _ in range(len(stages) + 1)]
+    threads = [
+        threading.Thread(target=_stage, args=(fn, queues[i], queues[i + 1]), daemon=True)
+        for i, fn in enumerate(stages)
+    ]
+    for t in threads: t.start()
+
+    # Discover: feeds lazily, blocking whenever decode is queue_depth items ahead
+    def discover():
+        try:
+            for path in sources:
+                if cancel_event is not None and cancel_event.is_set(): break
+                queues[0].put((path, True, {'started': time.perf_counter(), 'error': None}))
+        finally:
+            queues[0].put(_DONE)
+    feeder = threading.Thread(target=discover, daemon=True)
+    feeder.start()
+
+    # Write runs on the calling thread
+    count = 0
+    while True:
+        item = queues[-1].get()
+        if item is _DONE: break
+        path, encoded, info = item
+        saved = None
+        if encoded is not None:
+            try:
+                saved = []
+                for spec, size, data in encoded:
+                    saved.append(processor.output_path(path, save_dir, settings, spec, size))
+                    with metrics.stage("write"), open(saved[-1], 'wb') as f:
+                        f.write(data)
+                if not settings.get('derivatives'): saved = saved[0]
+                count += 1
+            except Exception as e:
+                print(f"Error saving {path}: {e}")
+                info['error'] = str(e)
+                saved = None
+        if on_file_done: on_file_done(path, saved, info['error'], time.perf_counter() - info['started'])
+
+    feeder.join()
+    for t in threads: t.join()
+    return count
@@ -0,0 +1,151 @@
+"""
+Hot-folder mode: watch an input directory and export new or changed images.
+
+File events come from watchdog (inotify / FSEvents / ReadDirectoryChangesW)
+when it is installed, otherwise from polling mtimes. A file is only exported
+once its size and mtime have stayed the same for settle_seconds, so copies
+still in progress are left alone. Finished files are looked up in the
+output directory's ExportJournal, so a restart skips everything already
+exported with the same settings from an unchanged source.
+"""
+import os
+import threading
+import time
+
+from export_journal import ExportJournal
+from image_core import IMAGE_EXTENSIONS, iter_image_files
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+HAS_WATCHDOG = Observer is not None
+
+class HotFolder:
+    """
+    on_batch(files, exported) is called after each batch is processed.
+    workers is passed to run_full_export (1 = streaming pipeline, no process pool).
+    """
+    def __init__(self, processor, input_dir, output_dir, settings, recursive=True,
+                 settle_seconds=2.0, poll_interval=1.0, workers=1, use_events=True, on_batch=None):
+        self.processor = processor
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.settings = settings
+        self.recursive = recursive
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.workers = workers
+        self.on_batch = on_batch
+        self.use_events = use_events and HAS_WATCHDOG
+        self.stop_event = threading.Event()
+        self._seen = {}        # polling snapshot: path -> (mtime, size)
+        self._pending = {}     # debounce: path -> (mtime, size, stable_since)
+        self._dirty = set()    # paths reported by the event observer
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.journal = ExportJournal(self.output_dir, settings)
+
+    def _wanted(self, path):
+        path = os.path.abspath(path)
+        return (path.lower().endswith(IMAGE_EXTENSIONS)
+                and not path.startswith(self.output_dir + os.sep)
+                and (self.recursive or os.path.dirname(path) == self.input_dir))
+
+    def scan(self):
+        """Full directory walk: queues every file that is new or changed since the last scan."""
+        for path in iter_image_files(self.input_dir, self.recursive):
+            if not self._wanted(path): continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = (st.st_mtime, st.st_size)
+            if self._seen.get(path) != key:
+                self._seen[path] = key
+                self._note(path, st)
+
+    def _note(self, path, st=None):
+        try:
+            st = st or os.stat(path)
+        except OSError:
+            return
+        mtime_size = (st.st_mtime, st.st_size)
+        current = self._pending.get(path)
+        if current is None or current[:2] != mtime_size:
+            self._pending[path] = (*mtime_size, time.monotonic())
+
+    def ready_files(self):
+        """Pending files whose size/mtime held still for settle_seconds and that aren't exported yet."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        for path in dirty: self._note(path)
+
+        now = time.monotonic()
+        ready = []
+        for path, (mtime, size, since) in list(self._pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self._pending[path]  # deleted or moved away
+                continue
+            if (st.st_mtime, st.st_size) != (mtime, size):
+                self._pending[path] = (st.st_mtime, st.st_size, now)
+            elif now - since >= self.settle_seconds:
+                del self._pending[path]
+                if not self.journal.is_done(path): ready.append(path)
+        return sorted(ready)
+
+    def run_once(self):
+        """One poll cycle; returns the number of files exported."""
+        if not self.use_events: self.scan()
+        files = self.ready_files()
+        if not files: return 0
+        exported = self.processor.run_full_export(files, self.output_dir, self.settings, workers=self.workers)
+        if self.on_batch: self.on_batch(files, exported)
+        return exported
+
+    def run(self):
+        """Blocks until stop() is called (or KeyboardInterrupt)."""
+        observer = None
+        self.scan()  # files that arrived while we weren't running
+        if self.use_events:
+            observer = Observer()
+            observer.schedule(_EventHandler(self), self.input_dir, recursive=self.recursive)
+            observer.start()
+        try:
+            while not self.stop_event.is_set():
+                self.run_once()
+                self.stop_event.wait(self.poll_interval)
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()
+            self.journal.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+if HAS_WATCHDOG:
+    class _EventHandler(FileSystemEventHandler):
+        """Collects touched paths; debouncing and export happen on the polling thread."""
+        def __init__(self, folder):
+            self.folder = folder
+
+        def _touch(self, path, is_directory=False):
+            # A directory moved in arrives as a single event; pick up its contents
+            paths = iter_image_files(path, self.folder.recursive) if is_directory else [path]
+            with self.folder._lock:
+                for p in paths:
+                    if self.folder._wanted(p): self.folder._dirty.add(os.path.abspath(p))
+
+        def on_created(self, event):
+            self._touch(event.src_path, event.is_directory)
+
+        def on_modified(self, event):
+            if not event.is_directory: self._touch(event.src_path)
+
+        def on_moved(self, event):
+            self._touch(event.dest_path, event.is_directory)
@@ -0,0 +1,179 @@
+from collections import OrderedDict
+from PIL import Image, features
+import io
+import os
+import sqlite3
+import threading
+import time
+
+from large_image import estimated_bytes
+
+class LRUCache:
+    """
+    Small thread-safe LRU map.
+    Bounded by max_entries and/or max_bytes (measured with sizeof);
+    oldest entries are evicted first. Keeps hit/miss counters.
+    """
+    def __init__(self, max_entries=32, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if self.max_bytes is not None and size > self.max_bytes: return
+            if key in self._items:
+                self.current_bytes -= self._items.pop(key)[1]
+            self._items[key] = (value, size)
+            self.current_bytes += size
+            while self._over_budget():
+                _, (_, old_size) = self._items.popitem(last=False)
+                self.current_bytes -= old_size
+                self.evictions += 1
+
+    def _over_budget(self):
+        if self.max_entries is not None and len(self._items) > self.max_entries: return True
+        if self.max_bytes is not None and self.current_bytes > self.max_bytes: return True
+        return False
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self.current_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+def image_nbytes(img):
+    """Approximate decoded size of a PIL image in bytes."""
+    return estimated_bytes(img.size, img.mode)
+
+class ThumbnailStore:
+    """
+    Persistent thumbnail cache in a single SQLite file.
+    Entries are keyed by (path, size) and validated against the source's
+    mtime and byte size, so edited files are re-thumbnailed automatically.
+    """
+    def __init__(self, db_path="thumbnails.db", max_entries=20000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.format = "WEBP" if features.check("webp") else "PNG"
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        # Connect lazily so processes that never thumbnail don't create the file
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS thumbs (
+                    path TEXT, size TEXT, mtime REAL, fsize INTEGER,
+                    data BLOB, created REAL,
+                    PRIMARY KEY (path, size)
+                )""")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, path, size):
+        try:
+            st = os.stat(path)
+            with self._lock:
+                row = self._db().execute(
+                    "SELECT mtime, fsize, data FROM thumbs WHERE path=? AND size=?",
+                    (path, _size_key(size))
+                ).fetchone()
+            if not row: return None
+            if row[0] != st.st_mtime or row[1] != st.st_size:
+                self.delete(path)
+                return None
+            img = Image.open(io.BytesIO(row[2]))
+            img.load()
+            return img
+        except Exception:
+            return None
+
+    def put(self, path, size, thumb):
+        try:
+            st = os.stat(path)
+            buf = io.BytesIO()
+            thumb.save(buf, format=self.format, quality=85)
+            with self._lock:
+                db = self._db()
+                db.execute(
+                    "INSERT OR REPLACE INTO thumbs VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, _size_key(size), st.st_mtime, st.st_size, buf.getvalue(), time.time())
+                )
+                db.commit()
+        except Exception as e:
+            print(f"Thumbnail cache write failed for {path}: {e}")
+
+    def delete(self, path):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM thumbs WHERE path=?", (path,))
+            db.commit()
+
+    def prune(self):
+        """
+        Drops entries whose source is gone or changed, then trims the oldest
+        entries beyond max_entries. Returns the number of rows removed.
+        Sources are stat'ed without holding the lock, so get/put keep working meanwhile.
+        """
+        with self._lock:
+            rows = self._db().execute("SELECT DISTINCT path, mtime, fsize FROM thumbs").fetchall()
+        stale = []
+        for path, mtime, fsize in rows:
+            try:
+                st = os.stat(path)
+                if st.st_mtime != mtime or st.st_size != fsize: stale.append((path, mtime, fsize))
+            except OSError:
+                stale.append((path, mtime, fsize))
+        with self._lock:
+            db = self._db()
+            before = db.total_changes
+            # Match the stat'ed version: rows re-put meanwhile are fresh
+            db.executemany("DELETE FROM thumbs WHERE path=? AND mtime=? AND fsize=?", stale)
+            if self.max_entries:
+                db.execute(
+                    "DELETE FROM thumbs WHERE rowid NOT IN "
+                    "(SELECT rowid FROM thumbs ORDER BY created DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+            db.commit()
+            return db.total_changes - before
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def _size_key(size):
+    return f"{size[0]}x{size[1]}"
@@ -1,176 +1,824 @@
-from PIL import Image, ImageEnhance
+from PIL import Image
 import os
 import json
+import sqlite3
 from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import time
+
+from image_cache import LRUCache, ThumbnailStore, image_nbytes
+from export_stream import stream_export
+from export_journal import ExportJournal, decode_outputs
+from metrics import Metrics
+from encoding import encode, pillow_format
+from compositing import apply_opacity, composite, tile_layer
+from large_image import check_memory, composite_tiled_in_strips, draft_for_target, resize_in_strips
+
+# Extensions the library import accepts
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Pipeline settings shared by the GUI, the CLI and presets
+DEFAULT_SETTINGS = {
+    'wm_enabled': False, 'wm_path': None, 'wm_pos': 'center',
+    'wm_x': 0.5, 'wm_y': 0.5, 'wm_opacity': 0.8, 'wm_scale': 0.3, 'wm_tile_gap': 0.5,
+    'resize_enabled': False, 'resize_scale': 100,
+    'format': 'JPG',
+    # Encoder: preset is fast / balanced / smallest (see encoding.py); max_bytes
+    # (optional) searches for the highest quality that fits
+    'encoder_preset': 'balanced', 'quality': 95, 'max_bytes': None
+}
+# Optional 'derivatives': list of output targets rendered from one decode, each
+# {'scale': percent} or {'max_size': px or [w, h]}, plus 'format', 'label', a
+# filename 'pattern' ({name}, {label}, {ext}, {width}, {height}) and its own
+# 'encoder_preset', 'quality' and 'max_bytes' (defaulting to the settings').
+# When set, the resize/format settings above are ignored.
+DEFAULT_DERIVATIVE_PATTERN = "Processed_{name}_{label}.{ext}"
+
+def iter_image_files(root, recursive=True):
+    """Lazily yields image paths under root (sorted per directory), without listing the whole tree."""
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if recursive: yield from iter_image_files(entry.path, recursive)
+        elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            yield entry.path
 
 class HistoryManager:
-    def __init__(self, log_file="history.json"):
-        self.log_file = log_file
-        self.load_history()
+    """
+    Append-only history in SQLite (history.db). Writes are single-row
+    transactions, safe across threads and processes; reads are paginated
+    newest-first. An old history.json is imported once into an empty store.
+    """
+    def __init__(self, db_file="history.db", legacy_file="history.json", max_entries=None):
+        self.db_file = db_file
+        self.max_entries = max_entries
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT, operation TEXT, count INTEGER, location TEXT, details TEXT
+                )""")
+            # Stores created before run metrics were recorded lack the details column
+            columns = [row[1] for row in db.execute("PRAGMA table_info(history)")]
+            if "details" not in columns: db.execute("ALTER TABLE history ADD COLUMN details TEXT")
+        if legacy_file and os.path.exists(legacy_file) and self.count() == 0:
+            self._import_legacy(legacy_file)
 
-    def load_history(self):
-        if os.path.exists(self.log_file):
-            try:
-                with open(self.log_file, 'r') as f:
-                    self.history = json.load(f)
-            except:
-                self.history = []
-        else:
-            self.history = []
-
-    def add_entry(self, operation, count, save_path):
-        entry = {
-            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "operation": operation,
-            "count": count,
-            "location": save_path
-        }
-        self.history.insert(0, entry)
-        self.save_history()
+    def _connect(self):
+        db = sqlite3.connect(self.db_file, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
 
-    def save_history(self):
-        with open(self.log_file, 'w') as f:
-            json.dump(self.history, f, indent=4)
-            
-    def get_history(self):
-        return self.history
+    def _import_legacy(self, legacy_file):
+        try:
+            with open(legacy_file, 'r') as f:
+                entries = json.load(f)
+        except Exception:
+            return
+        # history.json is newest-first; insert oldest-first so ids keep the order
+        rows = [(e.get("date"), e.get("operation"), e.get("count", 0), e.get("location")) for e in reversed(entries)]
+        with self._connect() as db:
+            db.executemany("INSERT INTO history (date, operation, count, location) VALUES (?, ?, ?, ?)", rows)
+
+    def add_entry(self, operation, count, save_path, details=None):
+        """details: optional JSON-serializable dict, e.g. the run's metrics summary."""
+        with self._connect() as db:
+            db.execute(
+                "INSERT INTO history (date, operation, count, location, details) VALUES (?, ?, ?, ?, ?)",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), operation, count, save_path,
+                 json.dumps(details) if details is not None else None)
+            )
+        if self.max_entries: self.compact(self.max_entries)
+
+    def get_history(self, limit=None, offset=0):
+        """Newest-first page of entries; limit=None returns everything from offset."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT date, operation, count, location, details FROM history ORDER BY id DESC LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            ).fetchall()
+        return [
+            {"date": r[0], "operation": r[1], "count": r[2], "location": r[3],
+             "details": json.loads(r[4]) if r[4] else None}
+            for r in rows
+        ]
+
+    def count(self):
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def compact(self, keep):
+        """Retention: keeps the newest `keep` entries."""
+        with self._connect() as db:
+            db.execute("DELETE FROM history WHERE id <= (SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)", (keep,))
 
 class ImageProcessor:
-    def __init__(self):
-        self.history_mgr = HistoryManager()
+    def __init__(self, track_history=True, image_cache_bytes=256 * 1024 * 1024, thumb_db="thumbnails.db",
+                 large_image_pixels=50_000_000, max_image_bytes=2 * 1024 ** 3, max_image_pixels=None,
+                 instrument=False, profiler_hook=None):
+        self.history_mgr = HistoryManager() if track_history else None
+        # Per-stage timers and counters; near-free when instrument=False
+        self.metrics = Metrics(enabled=instrument, sample_memory=instrument, profiler_hook=profiler_hook)
+        self.last_run_metrics = None
+        # Images above large_image_pixels are processed in strips (see large_image);
+        # max_image_bytes is the per-image decoded memory ceiling for exports
+        self.large_image_pixels = large_image_pixels
+        self.max_image_bytes = max_image_bytes
+        # Raises Pillow's decompression-bomb limit for trusted very large inputs
+        self.max_image_pixels = max_image_pixels
+        if max_image_pixels: Image.MAX_IMAGE_PIXELS = max_image_pixels
+        self.thumb_store = ThumbnailStore(thumb_db) if thumb_db else None
+        self.wm_cache = LRUCache(max_entries=16)
+        # Decoded sources and screen-sized previews, bounded by memory rather than entry count
+        self.image_cache = LRUCache(max_entries=None, max_bytes=image_cache_bytes, sizeof=image_nbytes)
 
-    def load_image(self, file_path):
+    def load_image(self, file_path, use_cache=True):
+        """
+        Returns the decoded image. Cached images are shared: treat them as read-only.
+        """
+        try:
+            if not use_cache: return Image.open(file_path)
+            st = os.stat(file_path)
+            key = (file_path, st.st_mtime, st.st_size)
+            img = self.image_cache.get(key)
+            if img is None:
+                self.metrics.count("image_cache.miss")
+                with self.metrics.stage("decode"):
+                    img = Image.open(file_path)
+                    img.load()
+                self.image_cache.put(key, img)
+            else:
+                self.metrics.count("image_cache.hit")
+            return img
+        except Exception:
+            self.metrics.count("errors.load")
+            return None
+
+    def load_for_export(self, file_path, settings, metrics=None):
+        """
+        Opens a file for export (uncached). When the plan downsizes a large
+        image, JPEGs are decoded straight at a reduced size; images that
+        still can't fit max_image_bytes raise MemoryError instead of loading.
+        Returns (image, original_size).
+        metrics: where to record (default self.metrics); the same goes for the
+        pipeline, encode and export methods below.
+        """
+        metrics = metrics or self.metrics
+        with metrics.stage("decode"):
+            img = Image.open(file_path)
+            src_size = img.size
+            if src_size[0] * src_size[1] > self.large_image_pixels:
+                for op, arg in self.plan_pipeline(settings, src_size):
+                    if op == "resize" and arg[0] < src_size[0]: draft_for_target(img, arg)
+            check_memory(img, self.max_image_bytes)
+            img.load()
+        metrics.count("pixels_in", src_size[0] * src_size[1])
+        if metrics.enabled: metrics.count("bytes_in", os.path.getsize(file_path))
+        return img, src_size
+
+    def get_image_size(self, file_path):
+        """Reads the dimensions from the header without decoding pixels."""
         try:
-            return Image.open(file_path)
-        except:
+            with Image.open(file_path) as img:
+                return img.size
+        except Exception:
+            self.metrics.count("errors.load")
             return None
 
-    def get_thumbnail(self, pil_image, size=(100, 100)):
+    def _reduced_copy(self, source, size, resample, reducing_gap):
+        """
+        Shrinks source (a file path or a PIL image) to fit size.
+        Paths are opened lazily so thumbnail() can decode at reduced resolution:
+        JPEG gets a DCT-scaled draft, other formats go through reduce() first.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            img = Image.open(source)
+        else:
+            img = source.copy()
+        img.thumbnail(size, resample, reducing_gap=reducing_gap)
+        return img
+
+    def get_thumbnail(self, source, size=(100, 100)):
+        """
+        Thumbnails requested by path go through the persistent thumbnail store.
+        """
         try:
-            thumb = pil_image.copy()
-            thumb.thumbnail(size)
+            from_path = isinstance(source, (str, os.PathLike)) and self.thumb_store
+            if from_path:
+                thumb = self.thumb_store.get(os.fspath(source), size)
+                if thumb:
+                    self.metrics.count("thumb_store.hit")
+                    return thumb
+                self.metrics.count("thumb_store.miss")
+            with self.metrics.stage("thumbnail"):
+                thumb = self._reduced_copy(source, size, Image.Resampling.BICUBIC, 2.0)
+            if from_path: self.thumb_store.put(os.fspath(source), size, thumb)
             return thumb
-        except:
+        except Exception:
+            self.metrics.count("errors.thumbnail")
             return None
 
-    def get_preview(self, pil_image, max_size=(800, 600)):
+    def get_preview(self, source, max_size=(800, 600)):
+        """
+        Screen-sized copy. Previews of paths are kept in image_cache keyed by
+        (path, mtime, size, max_size), so going back to an image doesn't
+        decode it again; like load_image's results they are shared, read-only.
+        """
         try:
-            preview = pil_image.copy()
-            preview.thumbnail(max_size, Image.Resampling.LANCZOS)
+            key = None
+            if isinstance(source, (str, os.PathLike)):
+                st = os.stat(source)
+                key = ("preview", os.fspath(source), st.st_mtime, st.st_size, tuple(max_size))
+                preview = self.image_cache.get(key)
+                if preview is not None:
+                    self.metrics.count("image_cache.hit")
+                    return preview
+                self.metrics.count("image_cache.miss")
+            with self.metrics.stage("preview"):
+                preview = self._reduced_copy(source, max_size, Image.Resampling.LANCZOS, 3.0)
+            if key: self.image_cache.put(key, preview)
             return preview
-        except:
+        except Exception:
+            self.metrics.count("errors.preview")
             return None
 
     # --- Core Operations (Stateless) ---
 
-    def _apply_watermark(self, img, wm_path, pos_type, x_pct, y_pct, opacity, scale):
-        try:
-            watermark = Image.open(wm_path).convert("RGBA")
-            base_w, base_h = img.size
-            
-            # Resize WM
-            wm_w, wm_h = watermark.size
-            aspect = wm_w / wm_h
-            new_wm_w = int(base_w * scale)
-            new_wm_h = int(new_wm_w / aspect)
-            watermark = watermark.resize((new_wm_w, new_wm_h), Image.Resampling.LANCZOS)
-            
-            # Opacity
-            alpha = watermark.split()[3]
-            alpha = ImageEnhance.Brightness(alpha).enhance(opacity)
-            watermark.putalpha(alpha)
-
-            # Position
-            if pos_type == "manual":
-                final_x = int((base_w * x_pct) - (new_wm_w / 2))
-                final_y = int((base_h * y_pct) - (new_wm_h / 2))
-            else:
-                padding = int(base_w * 0.05)
-                if pos_type == "center":
-                    final_x, final_y = (base_w - new_wm_w)//2, (base_h - new_wm_h)//2
-                elif pos_type == "top_left":
-                    final_x, final_y = padding, padding
-                elif pos_type == "top_right":
-                    final_x, final_y = base_w - new_wm_w - padding, padding
-                elif pos_type == "bottom_left":
-                    final_x, final_y = padding, base_h - new_wm_h - padding
-                elif pos_type == "bottom_right":
-                    final_x, final_y = base_w - new_wm_w - padding, base_h - new_wm_h - padding
+    def _prepare_watermark(self, wm_path, opacity, target_w, metrics):
+        """
+        Returns the logo resized to target_w with opacity baked into its alpha.
+        Cached per (path, mtime, opacity, width) since these are constant for a batch.
+        """
+        src_key = (wm_path, os.path.getmtime(wm_path))
+        key = src_key + (round(opacity, 3), target_w)
+        watermark = self.wm_cache.get(key)
+        if watermark is not None:
+            metrics.count("wm_cache.hit")
+            return watermark
+        metrics.count("wm_cache.miss")
+
+        # Decoded logo is kept too, so slider ticks only redo resize/opacity
+        source = self.wm_cache.get(src_key)
+        if source is None:
+            source = Image.open(wm_path).convert("RGBA")
+            self.wm_cache.put(src_key, source)
+        watermark = source
+
+        # Resize WM
+        wm_w, wm_h = watermark.size
+        aspect = wm_w / wm_h
+        new_wm_h = int(target_w / aspect)
+        watermark = watermark.resize((target_w, new_wm_h), Image.Resampling.LANCZOS)
+
+        # Opacity
+        watermark = apply_opacity(watermark, opacity)
+
+        self.wm_cache.put(key, watermark)
+        return watermark
+
+    def _apply_watermark(self, img, wm_path, pos_type, x_pct, y_pct, opacity, scale, in_place=False, tile_gap=0.5,
+                         metrics=None):
+        metrics = metrics or self.metrics
+        with metrics.stage("watermark"):
+            try:
+                base_w, base_h = img.size
+                watermark = self._prepare_watermark(wm_path, opacity, int(base_w * scale), metrics)
+                new_wm_w, new_wm_h = watermark.size
+
+                # Repeated pattern over the whole frame
+                if pos_type == "tile":
+                    if self._is_large(img):
+                        return composite_tiled_in_strips(img, watermark, tile_gap, self.max_image_bytes, in_place)
+                    return composite(img, tile_layer(watermark, img.size, tile_gap), 0, 0, in_place)
+
+                # Position
+                if pos_type == "manual":
+                    final_x = int((base_w * x_pct) - (new_wm_w / 2))
+                    final_y = int((base_h * y_pct) - (new_wm_h / 2))
                 else:
-                    final_x, final_y = 0, 0
+                    padding = int(base_w * 0.05)
+                    if pos_type == "center":
+                        final_x, final_y = (base_w - new_wm_w)//2, (base_h - new_wm_h)//2
+                    elif pos_type == "top_left":
+                        final_x, final_y = padding, padding
+                    elif pos_type == "top_right":
+                        final_x, final_y = base_w - new_wm_w - padding, padding
+                    elif pos_type == "bottom_left":
+                        final_x, final_y = padding, base_h - new_wm_h - padding
+                    elif pos_type == "bottom_right":
+                        final_x, final_y = base_w - new_wm_w - padding, base_h - new_wm_h - padding
+                    else:
+                        final_x, final_y = 0, 0
 
-            final_img = img.convert("RGBA")
-            final_img.paste(watermark, (final_x, final_y), watermark)
-            return final_img.convert("RGB")
-        except:
-            return img
+                return composite(img, watermark, final_x, final_y, in_place)
+            except Exception:
+                metrics.count("errors.watermark")
+                return img
 
-    def _resize(self, img, scale_percent):
+    def _resize_to(self, img, size, metrics=None):
+        metrics = metrics or self.metrics
         try:
-            w, h = img.size
-            new_w = int(w * (scale_percent / 100))
-            new_h = int(h * (scale_percent / 100))
-            return img.resize((new_w, new_h), Image.Resampling.LANCZOS)
-        except:
+            with metrics.stage("resize"):
+                if self._is_large(img): return resize_in_strips(img, size, self.max_image_bytes)
+                return img.resize(size, Image.Resampling.LANCZOS)
+        except Exception:
+            metrics.count("errors.resize")
             return img
 
+    def _is_large(self, img):
+        return img.width * img.height > self.large_image_pixels
+
+    def _watermark_from_settings(self, img, settings, in_place=False, metrics=None):
+        return self._apply_watermark(
+            img,
+            settings['wm_path'],
+            settings.get('wm_pos', 'center'),
+            settings.get('wm_x', 0.5),
+            settings.get('wm_y', 0.5),
+            settings.get('wm_opacity', 0.8),
+            settings.get('wm_scale', 0.3),
+            in_place,
+            settings.get('wm_tile_gap', 0.5),
+            metrics
+        )
+
     # --- Pipeline Processor (Combines everything) ---
 
-    def process_pipeline(self, img, settings):
+    def plan_pipeline(self, settings, src_size):
+        """
+        Builds the ordered list of operations for an image of src_size:
+        [("resize", (w, h)), ("watermark", None)] in execution order.
+        No-op steps are skipped. Downscales run before the watermark: the logo
+        geometry is relative to the frame, so compositing at the final size
+        looks the same while touching fewer pixels and resampling the logo once.
+        Upscales keep the original Watermark -> Resize order.
+        With derivatives the resize targets the largest one (never above the source).
+        """
+        plan = []
+        resize = None
+        if settings.get('derivatives'):
+            # Largest derivative, capped at the source: upscaled targets are made from
+            # the source-resolution composite, smaller ones chain down (render_outputs)
+            w, h = self.derivative_sizes(settings, src_size)[0][1]
+            target = (min(w, src_size[0]), min(h, src_size[1]))
+            if target != tuple(src_size): resize = ("resize", target)
+        elif settings.get('resize_enabled', False):
+            factor = settings.get('resize_scale', 100) / 100
+            target = (max(1, int(src_size[0] * factor)), max(1, int(src_size[1] * factor)))
+            if target != tuple(src_size): resize = ("resize", target)
+
+        watermark = None
+        if settings.get('wm_enabled', False) and settings.get('wm_path') and settings.get('wm_scale', 0.3) > 0:
+            watermark = ("watermark", None)
+
+        downscale = resize is not None and resize[1][0] < src_size[0]
+        if downscale: plan.append(resize)
+        if watermark: plan.append(watermark)
+        if resize and not downscale: plan.append(resize)
+        return plan
+
+    def process_pipeline(self, img, settings, in_place=False, src_size=None, metrics=None):
         """
-        Applies all enabled effects in order: Watermark -> Resize
+        Runs the planned operations (see plan_pipeline) on img.
+        in_place=True lets the watermark draw straight into img; only pass it
+        when the caller owns img (never for cached images).
+        src_size is the original size when img was decoded reduced (load_for_export).
         Note: Conversion happens at save time.
         """
         processed_img = img
-        
-        # 1. Apply Watermark
+        owned = in_place
+        for op, arg in self.plan_pipeline(settings, src_size or img.size):
+            if op == "resize":
+                if arg == processed_img.size: continue
+                processed_img = self._resize_to(processed_img, arg, metrics)
+                owned = True
+            elif op == "watermark":
+                processed_img = self._watermark_from_settings(processed_img, settings, owned, metrics)
+        return processed_img
+
+    def derivative_sizes(self, settings, src_size):
+        """[(spec, (w, h))] for settings['derivatives'], largest first."""
+        sized = []
+        for spec in settings['derivatives']:
+            max_size = spec.get('max_size')
+            if max_size:
+                if isinstance(max_size, (int, float)): max_size = (max_size, max_size)
+                size = _fit_size(src_size, max_size)
+            else:
+                factor = spec.get('scale', 100) / 100
+                size = (max(1, int(src_size[0] * factor)), max(1, int(src_size[1] * factor)))
+            sized.append((spec, size))
+        sized.sort(key=lambda item: item[1][0] * item[1][1], reverse=True)
+        return sized
+
+    def render_outputs(self, img, settings, in_place=False, src_size=None, metrics=None):
+        """
+        Runs the pipeline and returns [(spec, image)] ready to encode:
+        [(None, image)] for plain settings, one entry per derivative otherwise.
+        Derivatives share one decode and one watermark composite (applied at
+        the largest target, or at source resolution when that is an upscale).
+        Upscaled targets are resampled from that composite; each smaller target
+        from the next larger one at or below source resolution, never from an
+        upscaled copy.
+        """
+        src_size = src_size or img.size
+        base = self.process_pipeline(img, settings, in_place, src_size, metrics)
+        if not settings.get('derivatives'): return [(None, self.prepare_for_save(base, settings, metrics))]
+
+        outputs = []
+        current = base
+        for spec, size in self.derivative_sizes(settings, src_size):
+            if size[0] > base.width or size[1] > base.height:
+                outputs.append((spec, self.prepare_for_save(self._resize_to(base, size, metrics), spec, metrics)))
+                continue
+            if size != current.size: current = self._resize_to(current, size, metrics)
+            outputs.append((spec, self.prepare_for_save(current, spec, metrics)))
+        return outputs
+
+    def process_proxy_pipeline(self, proxy, settings, source_size, max_size=(800, 600)):
+        """
+        Preview variant of process_pipeline that runs on a screen-sized proxy.
+        Watermark placement/scale are relative to the frame so they map 1:1;
+        the resize step is mapped to how the full-size export would be previewed.
+        """
+        processed_img = proxy
+
+        # 1. Apply Watermark (same relative geometry as the export)
         if settings.get('wm_enabled', False) and settings.get('wm_path'):
-            processed_img = self._apply_watermark(
-                processed_img,
-                settings['wm_path'],
-                settings.get('wm_pos', 'center'),
-                settings.get('wm_x', 0.5),
-                settings.get('wm_y', 0.5),
-                settings.get('wm_opacity', 0.8),
-                settings.get('wm_scale', 0.3)
-            )
-            
-        # 2. Apply Resize
+            processed_img = self._watermark_from_settings(processed_img, settings)
+
+        # 2. Size the export would have, fitted like get_preview does
+        out_w, out_h = source_size
         if settings.get('resize_enabled', False):
-            processed_img = self._resize(processed_img, settings.get('resize_scale', 100))
-            
+            factor = settings.get('resize_scale', 100) / 100
+            out_w, out_h = int(out_w * factor), int(out_h * factor)
+        target = _fit_size((out_w, out_h), max_size)
+        if target != processed_img.size and min(target) > 0:
+            processed_img = processed_img.resize(target, Image.Resampling.LANCZOS)
+
         return processed_img
 
-    def run_full_export(self, files, save_dir, settings):
-        count = 0
-        for path in files:
+    # --- Export ---
+
+    def output_path(self, path, save_dir, settings, spec=None, size=None):
+        """spec/size: the derivative being written (see render_outputs), if any."""
+        target_fmt = (spec or settings).get('format', 'JPG')
+        name_no_ext = os.path.splitext(os.path.basename(path))[0]
+        if spec is None: return os.path.join(save_dir, f"Processed_{name_no_ext}.{target_fmt.lower()}")
+        label = spec.get('label')
+        if not label:
+            max_size = spec.get('max_size')
+            if isinstance(max_size, (list, tuple)): label = f"{max_size[0]}x{max_size[1]}"
+            elif max_size: label = f"{max_size}px"
+            else: label = f"{spec.get('scale', 100):g}pct"
+        width, height = size or (0, 0)
+        filename = spec.get('pattern', DEFAULT_DERIVATIVE_PATTERN).format(
+            name=name_no_ext, label=label, ext=target_fmt.lower(), width=width, height=height
+        )
+        return os.path.join(save_dir, filename)
+
+    def prepare_for_save(self, img, settings, metrics=None):
+        """settings may also be a derivative spec (only 'format' is read)."""
+        # 3. Apply Format Conversion (Logic is handled by save params)
+        if pillow_format(settings.get('format')) == "JPEG":
+            if img.mode == "RGBA":
+                img = img.convert("RGB")
+        (metrics or self.metrics).count("pixels_out", img.width * img.height)
+        return img
+
+    def encode_image(self, img, settings, spec=None, metrics=None):
+        """Encodes to bytes in memory with the format's encoder preset (see encoding.encode)."""
+        metrics = metrics or self.metrics
+        option = lambda key, default: spec.get(key, settings.get(key, default)) if spec else settings.get(key, default)
+        overrides = {}
+        if settings.get('ico_sizes'): overrides['sizes'] = [tuple(s) for s in settings['ico_sizes']]
+        max_bytes = option('max_bytes', None)
+        with metrics.stage("encode"):
+            data, _ = encode(
+                img, (spec or settings).get('format', 'JPG'), option('encoder_preset', 'balanced'),
+                option('quality', 95), max_bytes, **overrides
+            )
+        if max_bytes and len(data) > max_bytes: metrics.count("encode.over_budget")
+        metrics.count("bytes_out", len(data))
+        return data
+
+    def export_file(self, path, save_dir, settings, metrics=None):
+        """
+        Load -> Pipeline -> Save for a single file.
+        Returns the saved path (a list of paths with derivatives).
+        """
+        metrics = metrics or self.metrics
+        img, src_size = self.load_for_export(path, settings, metrics)
+
+        # Run Pipeline (drop the source as soon as the result exists)
+        outputs = self.render_outputs(img, settings, in_place=True, src_size=src_size, metrics=metrics)
+        del img
+
+        saved = []
+        for spec, final_img in outputs:
+            # Encoded in memory (quality search may take several attempts); only the result hits the disk
+            data = self.encode_image(final_img, settings, spec, metrics)
+            save_path = self.output_path(path, save_dir, settings, spec, final_img.size)
+            with metrics.stage("write"), open(save_path, 'wb') as f:
+                f.write(data)
+            saved.append(save_path)
+        return saved if settings.get('derivatives') else saved[0]
+
+    def _worker_options(self):
+        """ImageProcessor keyword arguments for export worker processes (pool or queue workers)."""
+        return {
+            'large_image_pixels': self.large_image_pixels,
+            'max_image_bytes': self.max_image_bytes,
+            'max_image_pixels': self.max_image_pixels,
+            'instrument': self.metrics.enabled
+        }
+
+    def run_full_export(self, files, save_dir, settings, workers=1, progress_cb=None, cancel_event=None, resume=False,
+                        mp_context=None):
+        """
+        Exports every file through the pipeline. files may be a list or a lazy
+        iterator (e.g. iter_image_files); it is never materialized.
+        workers=1 runs the streaming stage pipeline (see export_stream).
+        workers > 1 spreads decode/pipeline/encode over a process pool
+        (LANCZOS and the JPEG/WEBP encoders hold the GIL, so threads don't help),
+        keeping only a couple of files per worker in flight. A worker process
+        that dies fails the files in flight; the rest go on in a new pool.
+        workers=None uses one process per CPU core.
+        progress_cb receives an ExportProgress snapshot dict after every file;
+        setting cancel_event stops the batch after the files already in flight.
+        Per-file results go to an ExportJournal in save_dir; resume=True skips
+        files already exported with the same settings from an unchanged source.
+        mp_context: multiprocessing context for the pool (default: the platform's).
+        """
+        total = len(files) if hasattr(files, '__len__') else None
+        if workers is None: workers = os.cpu_count() or 1
+        if total is not None: workers = min(workers, total)
+        workers = max(1, workers)
+        cancelled = lambda: cancel_event is not None and cancel_event.is_set()
+
+        with _ExportRun(self, total, save_dir, settings, progress_cb, resume) as run:
+            if workers == 1:
+                stream_export(self, run.pending(files), save_dir, settings, on_file_done=run.file_done,
+                              cancel_event=cancel_event, metrics=run.metrics)
+            else:
+                options = self._worker_options()
+                sources = run.pending(files)
+                in_flight = {}
+                pool = None
+                try:
+                    while True:
+                        # Once cancelled nothing new is submitted; running files finish and count
+                        while len(in_flight) < workers * 2 and not cancelled():
+                            path = next(sources, None)
+                            if path is None: break
+                            if pool is None:
+                                pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                                           initializer=_init_export_worker, initargs=(options,))
+                            in_flight[pool.submit(_export_worker, path, save_dir, settings)] = path
+                        if not in_flight: break
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        results = []
+                        for future in done:
+                            path = in_flight.pop(future)
+                            try:
+                                results.append((path, *future.result()))
+                            except BrokenProcessPool:
+                                # A worker died (decoder segfault, OOM kill): the pool is unusable and every
+                                # file still in it fails too. Record them and go on in a fresh pool
+                                results += [(p, None, "export worker process died") for p in [path, *in_flight.values()]]
+                                in_flight.clear()
+                                pool.shutdown(wait=False, cancel_futures=True)
+                                pool = None
+                                break
+                            except Exception as e:
+                                results.append((path, None, str(e)))
+                        for result in results: run.file_done(*result)
+                finally:
+                    if pool: pool.shutdown(cancel_futures=True)
+        return run.progress.exported
+
+    def run_distributed_export(self, files, save_dir, settings, queue, progress_cb=None, cancel_event=None,
+                               resume=False, local_workers=0, poll_interval=1.0):
+        """
+        Coordinator side of a multi-node export (see work_queue). Submits the
+        files to queue and waits while workers anywhere export them; results
+        go to the journal, progress_cb and history exactly like run_full_export.
+        local_workers=N also starts N worker processes on this host through
+        queue.start_local_worker(options, worker_id); one that dies has its lease
+        released at once and is replaced while work remains.
+        """
+        files = list(files)
+        with _ExportRun(self, len(files), save_dir, settings, progress_cb, resume) as run:
+            pending = list(run.pending(files))
+            job = queue.submit(pending, save_dir, settings)
+            # The queue stores absolute paths; the journal keys on the caller's, like run_full_export
+            sources = {os.path.abspath(path): path for path in pending}
+
+            local = []  # [(process, worker_id)]
+            if local_workers:
+                from work_queue import local_worker_id
+                options = self._worker_options()
+                def start_local(n):
+                    worker_id = local_worker_id(n)
+                    return queue.start_local_worker(options, worker_id), worker_id
+                local = [start_local(n) for n in range(local_workers)]
+
+            last_seq = 0
+            while True:
+                if cancel_event is not None and cancel_event.is_set(): queue.cancel(job)
+                counts = queue.counts(job)
+                # A crashed local worker: hand its item back now instead of after the lease, and replace it
+                for n, (worker, worker_id) in enumerate(local):
+                    if worker.is_alive() or worker.exitcode == 0: continue
+                    queue.release(worker_id)
+                    worker.join()
+                    if counts.get('queued') or counts.get('leased'):
+                        local[n] = start_local(n)
+                        counts = queue.counts(job)
+                # Read results after counts, so the final pass sees everything
+                for row in queue.finished(job, last_seq):
+                    last_seq = row['seq']
+                    saved = decode_outputs(row['output'])
+                    saved = (saved if settings.get('derivatives') else saved[0]) if saved else None
+                    run.file_done(sources.get(row['source'], row['source']), saved, row['error'], row['seconds'], row['metrics'])
+                if not counts.get('queued') and not counts.get('leased'): break
+                time.sleep(poll_interval)
+
+            for worker, _ in local: worker.join()
+        return run.progress.exported
+
+    def start_export(self, files, save_dir, settings, workers=None, progress_cb=None, resume=False):
+        """
+        Runs run_full_export on a background thread. Returns an ExportJob handle.
+        The pool doesn't fork: the caller (the GUI) has other threads running, and
+        a child forked mid-way through one of them can deadlock on a copied lock.
+        """
+        job = ExportJob()
+        def target():
             try:
-                img = self.load_image(path)
-                if not img: continue
-                
-                # Run Pipeline
-                final_img = self.process_pipeline(img, settings)
-                
-                # 3. Apply Format Conversion (Logic is handled by save params)
-                target_fmt = settings.get('format', 'JPG')
-                
-                # Determine Filename
-                fname = os.path.basename(path)
-                name_no_ext = os.path.splitext(fname)[0]
-                out_name = f"Processed_{name_no_ext}.{target_fmt.lower()}"
-                
-                # Save
-                save_path = os.path.join(save_dir, out_name)
-                
-                if target_fmt == "JPG" or target_fmt == "JPEG":
-                    if final_img.mode == "RGBA":
-                        final_img = final_img.convert("RGB")
-                
-                final_img.save(save_path, quality=95)
-                count += 1
+                job.result = self.run_full_export(files, save_dir, settings, workers, progress_cb, job.cancel_event, resume,
+                                                  mp_context=_no_fork_context())
             except Exception as e:
-                print(f"Error saving {path}: {e}")
-                pass
-        
-        self.history_mgr.add_entry("Batch Export", count, save_dir)
-        return count
\ No newline at end of file
+                job.error = e
+        job.thread = threading.Thread(target=target, daemon=True)
+        job.thread.start()
+        return job
+
+class ExportJob:
+    """
+    Handle for a background export: poll is_running(), call cancel() to stop
+    cooperatively. result holds the exported count once finished.
+    """
+    def __init__(self):
+        self.cancel_event = threading.Event()
+        self.thread = None
+        self.result = None
+        self.error = None
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def is_running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def wait(self, timeout=None):
+        if self.thread: self.thread.join(timeout)
+        return self.result
+
+class _ExportRun:
+    """
+    Bookkeeping shared by run_full_export and run_distributed_export: the
+    journal, a fresh Metrics (so the summary leaves out preview/thumbnail work
+    recorded in processor.metrics meanwhile), progress and the history entry.
+    Leaving the with block, also through an exception (Ctrl+C, a failing
+    callback), commits the journal so resume picks up from there and records
+    the run in history.
+    """
+    def __init__(self, processor, total, save_dir, settings, progress_cb=None, resume=False):
+        self.processor = processor
+        self.save_dir = save_dir
+        self.resume = resume
+        self.progress = ExportProgress(total, progress_cb)
+        self.journal = ExportJournal(save_dir, settings)
+        shared = processor.metrics
+        self.metrics = Metrics(enabled=shared.enabled, sample_memory=shared.sample_memory,
+                               profiler_hook=shared.profiler_hook)
+
+    def pending(self, files):
+        """Lazily yields the files that still need exporting (with resume, the rest count as skipped)."""
+        for path in files:
+            if self.resume and self.journal.is_done(path):
+                self.progress.file_skipped(path)
+                continue
+            yield path
+
+    def file_done(self, path, saved, error=None, seconds=None, worker_metrics=None):
+        self.journal.record(path, saved, error, seconds)
+        self.metrics.merge(worker_metrics)
+        self.metrics.count("images" if saved else "errors.export")
+        self.progress.file_done(path, saved)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.journal.close()
+        processor = self.processor
+        processor.last_run_metrics = self.metrics.summary() if self.metrics.enabled else None
+        if processor.history_mgr:
+            processor.history_mgr.add_entry("Batch Export", self.progress.exported, self.save_dir,
+                                            details=processor.last_run_metrics)
+        return False
+
+class ExportProgress:
+    """
+    Tracks a running export and hands snapshot dicts to a progress callback:
+    files_done, files_total, exported, skipped, bytes_written, current_file,
+    elapsed, eta (seconds), files_per_sec, bytes_per_sec.
+    """
+    def __init__(self, total, callback=None):
+        self.total = total
+        self.callback = callback
+        self.started = time.perf_counter()
+        self.files_done = 0
+        self.exported = 0
+        self.skipped = 0
+        self.bytes_written = 0
+
+    def file_done(self, path, saved_path):
+        """saved_path may be a list (derivative exports)."""
+        self.files_done += 1
+        if saved_path:
+            self.exported += 1
+            for p in saved_path if isinstance(saved_path, list) else [saved_path]:
+                try:
+                    self.bytes_written += os.path.getsize(p)
+                except OSError:
+                    pass
+        if self.callback: self.callback(self.snapshot(path))
+
+    def file_skipped(self, path):
+        self.files_done += 1
+        self.skipped += 1
+        if self.callback: self.callback(self.snapshot(path))
+
+    def snapshot(self, current_file=None):
+        elapsed = time.perf_counter() - self.started
+        rate = self.files_done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.files_done if self.total is not None else None
+        return {
+            "files_done": self.files_done,
+            "files_total": self.total,
+            "exported": self.exported,
+            "skipped": self.skipped,
+            "bytes_written": self.bytes_written,
+            "current_file": current_file,
+            "elapsed": elapsed,
+            "eta": remaining / rate if rate and remaining is not None else None,
+            "files_per_sec": rate,
+            "bytes_per_sec": self.bytes_written / elapsed if elapsed > 0 else 0.0
+        }
+
+def _no_fork_context():
+    """forkserver where available (POSIX), otherwise spawn."""
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+def _fit_size(size, max_size):
+    """Size an image ends up at after thumbnail(max_size): shrink only, keep aspect."""
+    w, h = size
+    max_w, max_h = max_size
+    if w <= max_w and h <= max_h: return (w, h)
+    factor = min(max_w / w, max_h / h)
+    return (max(1, round(w * factor)), max(1, round(h * factor)))
+
+# --- Process Pool Workers ---
+# Each worker process keeps its own ImageProcessor (no history file access).
+
+_worker_processor = None
+
+def _init_export_worker(options):
+    global _worker_processor
+    _worker_processor = ImageProcessor(track_history=False, thumb_db=None, **options)
+
+def _export_worker(path, save_dir, settings):
+    """Returns (saved_path, error, seconds, metrics) for the journal and the run summary."""
+    metrics = _worker_processor.metrics
+    metrics.reset()
+    started = time.perf_counter()
+    try:
+        saved, error = _worker_processor.export_file(path, save_dir, settings), None
+    except Exception as e:
+        print(f"Error saving {path}: {e}")
+        saved, error = None, str(e)
+    return saved, error, time.perf_counter() - started, metrics.raw() if metrics.enabled else None
@@ -0,0 +1,74 @@
+"""
+Strip-based helpers for very large inputs (panoramas, scans).
+
+Pillow cannot decode most formats piecewise, so the savings come from:
+- decoding JPEGs at a DCT-reduced size when the export downsizes anyway,
+- resizing in horizontal strips (resize(box=...) reads the neighbouring
+  source rows it needs, so strips join seamlessly) so the resampler's
+  intermediate buffer stays small,
+- building tiled watermark layers one strip at a time,
+- refusing an image up front when it can't fit the per-image ceiling,
+  instead of letting a worker run the machine out of memory.
+"""
+from PIL import Image
+
+from compositing import composite, tile_layer
+
+def bytes_per_pixel(mode):
+    """Pillow's in-memory pixel size: RGB, LA, YCbCr etc. are padded to 4 bytes."""
+    if mode in ("1", "L", "P"): return 1
+    if mode.startswith("I;16"): return 2
+    return 4
+
+def estimated_bytes(size, mode):
+    return size[0] * size[1] * bytes_per_pixel(mode)
+
+def draft_for_target(img, target_size):
+    """
+    Asks the decoder for a reduced-resolution version that is still at least
+    target_size (JPEG only; a no-op for formats without draft support).
+    Must be called before the image is loaded.
+    """
+    if img.format == "JPEG":
+        img.draft(img.mode if img.mode in ("RGB", "L") else None, target_size)
+    return img
+
+def check_memory(img, max_bytes):
+    need = estimated_bytes(img.size, img.mode)
+    if max_bytes and need > max_bytes:
+        raise MemoryError(
+            f"{img.size[0]}x{img.size[1]} {img.mode} needs ~{need // 2**20} MB, "
+            f"over the {max_bytes // 2**20} MB per-image ceiling"
+        )
+
+def strip_rows(width, max_bytes, pixel_bytes=4):
+    """Rows per strip so that one strip buffer stays well under max_bytes."""
+    return max(64, int(max_bytes // 8 // max(1, width * pixel_bytes)))
+
+def resize_in_strips(img, size, max_bytes, resample=Image.Resampling.LANCZOS):
+    out_w, out_h = size
+    rows = strip_rows(max(out_w, img.width), max_bytes, bytes_per_pixel(img.mode))
+    scale_y = img.height / out_h
+    out = Image.new(img.mode, size)
+    for top in range(0, out_h, rows):
+        bottom = min(out_h, top + rows)
+        box = (0, top * scale_y, img.width, bottom * scale_y)
+        out.paste(img.resize((out_w, bottom - top), resample, box=box), (0, top))
+    return out
+
+def composite_tiled_in_strips(img, watermark, gap, max_bytes, in_place=False):
+    """Same result as composite(img, tile_layer(...)) without a full-frame layer."""
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGB")
+    elif not in_place:
+        img = img.copy()
+
+    cell_h = watermark.height + int(watermark.height * gap)
+    # Strips start on a cell boundary so the pattern lines up across strips
+    rows = max(cell_h, strip_rows(img.width, max_bytes) // cell_h * cell_h)
+    for top in range(0, img.height, rows):
+        band_h = min(rows, img.height - top)
+        band = img.crop((0, top, img.width, top + band_h))
+        band = composite(band, tile_layer(watermark, (img.width, band_h), gap), 0, 0, in_place=True)
+        img.paste(band, (0, top))
+    return img
@@ -1,12 +1,16 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
 import os
+import queue
+import threading
 import webbrowser 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
-from image_core import ImageProcessor
+from dedupe import ImportIndex, path_key
+from image_core import DEFAULT_SETTINGS, ImageProcessor
 from ui_components import (
-    GalleryItem, HistoryRow, ModernMenuButton, 
+    HistoryRow, ModernMenuButton, PreviewScheduler, ProgressPanel, VirtualFilmstrip,
     COLOR_BG, COLOR_SIDEBAR, COLOR_CARD, COLOR_ACCENT, COLOR_TEXT, COLOR_DANGER
 )
 
@@ -19,19 +23,39 @@ class ProImageStudio(ctk.CTk):
         super().__init__()
 
         # --- Logic ---
-        self.processor = ImageProcessor()
+        self.processor = ImageProcessor(instrument=True)
         self.selected_files = [] 
         self.current_preview_path = None
-        self.gallery_widgets = {} 
+
+        # Preview proxy: (path, screen-sized copy, source size) of the selected image,
+        # built on the preview worker the first time that path is rendered
+        self.use_proxy_preview = True
+        self.preview_max_size = (900, 700)
+        self.preview_proxy = None
+
+        # Async import state (thumbnails are produced on a thread pool)
+        self.import_pool = None
+        self.import_results = queue.Queue()
+        self.import_cancel = threading.Event()
+        self.import_pending = set()
+        self.import_total = 0
+        self.import_done = 0
+
+        # Duplicate detection: exact copies are skipped at import, near duplicates flagged
+        self.import_index = ImportIndex()
+        self.import_skipped = 0
+        self.near_duplicates = {}  # path -> the library image it looks like
+        self.skip_near_duplicates = True
+
+        # Background export state
+        self.export_job = None
+        self.export_updates = queue.Queue()
+        self.export_status = None
+        self.export_panel = None
         self.nav_buttons = {} 
         
         # Default Settings
-        self.settings = {
-            'wm_enabled': False, 'wm_path': None, 'wm_pos': 'center', 
-            'wm_x': 0.5, 'wm_y': 0.5, 'wm_opacity': 0.8, 'wm_scale': 0.3,
-            'resize_enabled': False, 'resize_scale': 100,
-            'format': 'JPG'
-        }
+        self.settings = dict(DEFAULT_SETTINGS)
 
         # --- Main Window ---
         self.title("Image Studio Pro")
@@ -53,6 +77,8 @@ class ProImageStudio(ctk.CTk):
 
         # Start
         self.change_view("home")
+        # Pruning stats every cached source; keep it off the Tk thread
+        if self.processor.thumb_store: threading.Thread(target=self.processor.thumb_store.prune, daemon=True).start()
 
     def setup_sidebar(self):
         self.sidebar = ctk.CTkFrame(self, width=240, corner_radius=0, fg_color=COLOR_SIDEBAR)
@@ -125,6 +151,10 @@ class ProImageStudio(ctk.CTk):
         self.preview_label = ctk.CTkLabel(self.viewport, text="Select an image to start editing", font=("Segoe UI", 18), text_color="gray")
         self.preview_label.pack(expand=True, fill="both", padx=5, pady=5)
         
+        self.import_panel = ProgressPanel(self.viewport_container, cancel_command=self.cancel_import)
+
+        self.preview_scheduler = PreviewScheduler(self, self.snapshot_preview, self.render_preview, self.show_preview)
+
         self.preview_label.bind("<Button-1>", self.on_preview_click)
         self.preview_label.bind("<B1-Motion>", self.on_preview_drag)
 
@@ -142,8 +172,13 @@ class ProImageStudio(ctk.CTk):
         self.tools_frame.pack(fill="both", expand=True, padx=25)
 
     def setup_filmstrip(self):
-        self.filmstrip_frame = ctk.CTkScrollableFrame(self, height=130, orientation="horizontal", label_text="", fg_color="transparent")
-        self.filmstrip_frame.grid(row=1, column=1, sticky="ew", padx=20, pady=(0, 20))
+        self.filmstrip = VirtualFilmstrip(self, self.load_preview, self.remove_image, self.request_thumbnail)
+        self.filmstrip.grid(row=1, column=1, sticky="ew", padx=20, pady=(0, 20))
+
+        # Lazy thumbnails for items scrolled into view
+        self.thumb_pool = ThreadPoolExecutor(max_workers=2)
+        self.thumb_results = queue.Queue()
+        self.thumb_poll_scheduled = False
 
     # ================= UI Logic =================
 
@@ -209,7 +244,7 @@ class ProImageStudio(ctk.CTk):
         self.create_slider("Scale", 0.1, 0.8, self.settings['wm_scale'], self.slider_scale_cb)
 
         self.section_header("PLACEMENT").pack(fill="x", pady=(20, 5))
-        self.combo_pos = ctk.CTkComboBox(self.tools_frame, values=["center", "bottom_right", "top_left", "manual"], command=self.on_pos_change, fg_color=COLOR_CARD, border_color=COLOR_CARD, button_color=COLOR_ACCENT)
+        self.combo_pos = ctk.CTkComboBox(self.tools_frame, values=["center", "bottom_right", "top_left", "tile", "manual"], command=self.on_pos_change, fg_color=COLOR_CARD, border_color=COLOR_CARD, button_color=COLOR_ACCENT)
         self.combo_pos.set(self.settings.get('wm_pos', 'center'))
         self.combo_pos.pack(fill="x", pady=5)
         
@@ -235,6 +270,12 @@ class ProImageStudio(ctk.CTk):
         self.combo_fmt.set(self.settings.get('format', 'JPG'))
         self.combo_fmt.pack(fill="x", pady=10)
 
+        self.section_header("ENCODER").pack(fill="x", pady=(20, 10))
+        self.combo_encoder = ctk.CTkSegmentedButton(self.tools_frame, values=["fast", "balanced", "smallest"], command=self.update_settings, selected_color=COLOR_ACCENT, selected_hover_color=COLOR_ACCENT)
+        self.combo_encoder.set(self.settings.get('encoder_preset', 'balanced'))
+        self.combo_encoder.pack(fill="x", pady=10)
+        self.create_slider("Quality (JPG / WEBP)", 10, 100, self.settings.get('quality', 95), self.slider_quality_cb)
+
     def build_export(self):
         card = ctk.CTkFrame(self.tools_frame, fg_color=COLOR_CARD, corner_radius=15)
         card.pack(fill="x", pady=10, ipadx=15, ipady=15)
@@ -245,8 +286,20 @@ class ProImageStudio(ctk.CTk):
         self.summary_row(card, "Watermark", "ON" if self.settings['wm_enabled'] else "OFF")
         self.summary_row(card, "Resize", f"{int(self.settings['resize_scale'])}%" if self.settings['resize_enabled'] else "OFF")
         self.summary_row(card, "Format", self.settings['format'])
+        if self.near_duplicates:
+            self.summary_row(card, "Near duplicates", str(len(self.near_duplicates)))
+            self.chk_skip_dupes = ctk.CTkCheckBox(card, text="Skip near duplicates", command=self.toggle_skip_duplicates, fg_color=COLOR_ACCENT)
+            if self.skip_near_duplicates: self.chk_skip_dupes.select()
+            self.chk_skip_dupes.pack(anchor="w", pady=(10, 0))
 
-        ctk.CTkButton(self.tools_frame, text="Start Batch Processing", command=self.run_pipeline_export, height=60, fg_color=COLOR_ACCENT, hover_color="#3b5bdb", font=("Segoe UI", 16, "bold"), corner_radius=12).pack(fill="x", pady=20)
+        self.btn_start_export = ctk.CTkButton(self.tools_frame, text="Start Batch Processing", command=self.run_pipeline_export, height=60, fg_color=COLOR_ACCENT, hover_color="#3b5bdb", font=("Segoe UI", 16, "bold"), corner_radius=12)
+        self.btn_start_export.pack(fill="x", pady=20)
+
+        self.export_panel = ProgressPanel(self.tools_frame, cancel_command=self.cancel_export)
+        if self.export_job and self.export_job.is_running():
+            self.btn_start_export.configure(state="disabled", text="Processing...")
+            self.export_panel.pack(fill="x")
+            if self.export_status: self.show_export_progress(self.export_status)
 
     def summary_row(self, master, label, value):
         f = ctk.CTkFrame(master, fg_color="transparent")
@@ -254,12 +307,21 @@ class ProImageStudio(ctk.CTk):
         ctk.CTkLabel(f, text=label, text_color="gray").pack(side="left")
         ctk.CTkLabel(f, text=value, text_color="white", font=("Segoe UI", 12, "bold")).pack(side="right")
 
-    def build_history(self):
-        history = self.processor.history_mgr.get_history()
+    def build_history(self, page_size=30):
         scroll = ctk.CTkScrollableFrame(self.tools_frame, fg_color="transparent")
         scroll.pack(fill="both", expand=True)
-        if not history: ctk.CTkLabel(scroll, text="No history yet", text_color="gray").pack(pady=20)
-        for entry in history: HistoryRow(scroll, entry)
+        history_mgr = self.processor.history_mgr
+        total = history_mgr.count()
+        if not total: ctk.CTkLabel(scroll, text="No history yet", text_color="gray").pack(pady=20)
+
+        # Rows are fetched a page at a time; "Load more" appends the next page
+        def load_page(offset):
+            for entry in history_mgr.get_history(limit=page_size, offset=offset): HistoryRow(scroll, entry)
+            if offset + page_size < total:
+                more = ctk.CTkButton(scroll, text="Load more", fg_color=COLOR_CARD, hover_color=COLOR_ACCENT, height=30)
+                more.configure(command=lambda: (more.destroy(), load_page(offset + page_size)))
+                more.pack(fill="x", pady=8)
+        load_page(0)
 
     def create_slider(self, label, min_val, max_val, current, callback):
         ctk.CTkLabel(self.tools_frame, text=label, text_color="gray", font=("Segoe UI", 12)).pack(anchor="w", pady=(10,0))
@@ -283,6 +345,12 @@ class ProImageStudio(ctk.CTk):
         self.lbl_resize_txt.configure(text=f"{int(val)}%")
         self.update_pipeline_preview()
 
+    def slider_quality_cb(self, val):
+        self.settings['quality'] = int(val)
+
+    def toggle_skip_duplicates(self):
+        self.skip_near_duplicates = bool(self.chk_skip_dupes.get())
+
     def update_settings(self, _=None):
         if self.current_view == "watermark":
             self.settings['wm_enabled'] = bool(self.chk_wm.get())
@@ -290,17 +358,41 @@ class ProImageStudio(ctk.CTk):
             self.settings['resize_enabled'] = bool(self.chk_resize.get())
         elif self.current_view == "convert":
             self.settings['format'] = self.combo_fmt.get()
+            self.settings['encoder_preset'] = self.combo_encoder.get()
         self.update_pipeline_preview()
 
+    def preview_source(self, path):
+        """Runs on the preview worker: decoding a large file never blocks the Tk thread."""
+        memo = self.preview_proxy
+        if memo and memo[0] == path: return memo[1], memo[2]
+        source_size = self.processor.get_image_size(path)
+        proxy = self.processor.get_preview(path, max_size=self.preview_max_size) if source_size else None
+        self.preview_proxy = (path, proxy, source_size)
+        return proxy, source_size
+
     def update_pipeline_preview(self):
+        # Rendering is coalesced and runs off the UI thread (see PreviewScheduler)
         if not self.current_preview_path: return
-        base = self.processor.load_image(self.current_preview_path)
-        if not base: return
-        processed = self.processor.process_pipeline(base, self.settings)
-        preview = self.processor.get_preview(processed, max_size=(900, 700))
-        if preview:
-            ctk_img = ctk.CTkImage(preview, size=preview.size)
-            self.preview_label.configure(image=ctk_img, text="")
+        self.preview_scheduler.request()
+
+    def snapshot_preview(self):
+        if not self.current_preview_path: return None
+        return (self.current_preview_path, dict(self.settings))
+
+    def render_preview(self, job):
+        path, settings = job
+        if self.use_proxy_preview:
+            proxy, source_size = self.preview_source(path)
+            if proxy is None: return None
+            return self.processor.process_proxy_pipeline(proxy, settings, source_size, max_size=self.preview_max_size)
+        base = self.processor.load_image(path)
+        if not base: return None
+        processed = self.processor.process_pipeline(base, settings)
+        return self.processor.get_preview(processed, max_size=self.preview_max_size)
+
+    def show_preview(self, preview):
+        ctk_img = ctk.CTkImage(preview, size=preview.size)
+        self.preview_label.configure(image=ctk_img, text="")
 
     # --- Mouse & Manual Pos ---
     def on_pos_change(self, choice):
@@ -322,42 +414,160 @@ class ProImageStudio(ctk.CTk):
     # --- Library ---
     def import_images(self):
         paths = filedialog.askopenfilenames(filetypes=[("Images", "*.jpg *.png *.jpeg *.webp")])
+        new_paths = []
         for path in paths:
-            if path not in self.selected_files:
+            # O(1) path check; content and look-alike checks run on the import workers
+            if not self.import_index.has_path(path) and path not in self.import_pending:
                 self.selected_files.append(path)
-                self.add_gallery_item(path)
+                new_paths.append(path)
+        if new_paths: self.start_import(new_paths)
+
+    def start_import(self, paths):
+        """
+        Thumbnails are decoded on a worker pool; results are streamed back
+        to the Tk thread in small batches by poll_import().
+        """
+        if self.import_pool is None:
+            # Fresh event per batch: workers of a cancelled batch keep seeing it set
+            self.import_cancel = threading.Event()
+            self.import_total, self.import_done, self.import_skipped = 0, 0, 0
+            self.import_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1))
+            self.import_panel.pack(side="bottom", fill="x", pady=(10, 0), before=self.viewport)
+            self.after(50, self.poll_import)
+
+        self.import_total += len(paths)
+        self.import_pending.update(paths)
+        for path in paths:
+            self.import_pool.submit(self._import_worker, path, self.import_cancel)
+
+    def _import_worker(self, path, cancel):
+        if cancel.is_set(): return
+        try:
+            kind, original = self.import_index.add_file(path)
+        except OSError:
+            kind, original = None, None
+        # cancel_import sets the event before un-indexing the pending paths, so a
+        # registration that raced past it is undone here
+        if cancel.is_set():
+            if not kind: self.import_index.remove(path)
+            return
+        if kind:
+            # Byte-identical to (or the same path as) a library image: no thumbnail needed
+            self.import_results.put((path, None, (kind, original)))
+            return
+        thumb = self.processor.get_thumbnail(path)
+        similar = self.import_index.add_thumbnail(path, thumb) if thumb else None
+        if cancel.is_set():
+            self.import_index.remove(path)
+            return
+        self.import_results.put((path, thumb, ("near", similar) if similar else None))
+
+    def poll_import(self, batch_size=24):
+        if self.import_pool is None: return
+        for _ in range(batch_size):
+            try:
+                path, thumb, duplicate = self.import_results.get_nowait()
+            except queue.Empty:
+                break
+            if path not in self.import_pending: continue
+            self.import_pending.discard(path)
+            self.import_done += 1
+            if duplicate and duplicate[0] != "near":
+                self.selected_files.remove(path)
+                self.import_skipped += 1
+                continue
+            if duplicate: self.near_duplicates[path] = duplicate[1]
+            if thumb:
+                self.add_gallery_item(path, thumb)
+                if not self.current_preview_path: self.load_preview(path)
+
+        self.import_panel.update_progress(
+            self.import_done / max(1, self.import_total),
+            f"Importing {self.import_done} / {self.import_total}"
+            + (f"  ({self.import_skipped} duplicates skipped)" if self.import_skipped else "")
+        )
+        if self.import_pending:
+            self.after(50, self.poll_import)
+        else:
+            self.finish_import()
+
+    def cancel_import(self):
+        if self.import_pool is None: return
+        self.import_cancel.set()
+        # Anything not thumbnailed yet is dropped from the library
+        self.selected_files = [p for p in self.selected_files if p not in self.import_pending]
+        for path in self.import_pending: self.import_index.remove(path)
+        self.drop_near_duplicates(self.import_pending)
+        self.import_pending.clear()
+        self.finish_import()
+
+    def drop_near_duplicates(self, paths):
+        """Forgets removed paths; look-alikes of a removed original now look like the first of them."""
+        for path in paths: self.near_duplicates.pop(path, None)
+        removed = {path_key(p) for p in paths}
+        orphans = {}
+        for path, original in self.near_duplicates.items():
+            if original in removed: orphans.setdefault(original, []).append(path)
+        for first, *others in orphans.values():
+            del self.near_duplicates[first]
+            for path in others: self.near_duplicates[path] = path_key(first)
+
+    def finish_import(self):
+        if self.import_pool is None: return
+        self.import_pool.shutdown(wait=False, cancel_futures=True)
+        self.import_pool = None
+        self.import_panel.pack_forget()
         if self.selected_files and not self.current_preview_path: self.load_preview(self.selected_files[0])
-        if self.current_view == "home": self.change_view("home") 
+        if self.current_view == "home": self.change_view("home")
 
-    def add_gallery_item(self, path):
-        img = self.processor.load_image(path)
-        if img:
-            thumb = self.processor.get_thumbnail(img)
-            ctk_thumb = ctk.CTkImage(thumb, size=thumb.size)
-            item = GalleryItem(self.filmstrip_frame, path, ctk_thumb, self.load_preview, self.remove_image)
-            item.pack(side="left", padx=5)
-            self.gallery_widgets[path] = item
+    def add_gallery_item(self, path, thumb=None):
+        self.filmstrip.add_item(path, thumb)
+
+    def request_thumbnail(self, path):
+        self.thumb_pool.submit(lambda: self.thumb_results.put((path, self.processor.get_thumbnail(path))))
+        if not self.thumb_poll_scheduled:
+            self.thumb_poll_scheduled = True
+            self.after(50, self.poll_thumbnails)
+
+    def poll_thumbnails(self):
+        try:
+            while True:
+                path, thumb = self.thumb_results.get_nowait()
+                self.filmstrip.set_thumbnail(path, thumb)
+        except queue.Empty:
+            pass
+        if self.filmstrip.requested:
+            self.after(50, self.poll_thumbnails)
+        else:
+            self.thumb_poll_scheduled = False
 
     def remove_image(self, widget, path):
         if path in self.selected_files: self.selected_files.remove(path)
-        widget.destroy()
-        del self.gallery_widgets[path]
+        self.import_index.remove(path)
+        self.drop_near_duplicates([path])
+        self.filmstrip.remove_item(path)
         if path == self.current_preview_path:
             self.current_preview_path = None
+            self.preview_proxy = None
+            self.preview_scheduler.invalidate()
             self.preview_label.configure(image=None, text="Image Removed")
             if self.selected_files: self.load_preview(self.selected_files[0])
         if self.current_view == "home": self.change_view("home")
 
     def load_preview(self, path):
         self.current_preview_path = path
-        for p, w in self.gallery_widgets.items(): w.set_selected(p == path)
+        self.filmstrip.set_selected(path)
         self.update_pipeline_preview()
 
     def clear_library(self):
-        for w in self.gallery_widgets.values(): w.destroy()
-        self.gallery_widgets.clear()
+        self.cancel_import()
+        self.filmstrip.clear()
         self.selected_files.clear()
+        self.import_index.clear()
+        self.near_duplicates.clear()
         self.current_preview_path = None
+        self.preview_proxy = None
+        self.preview_scheduler.invalidate()
         self.preview_label.configure(image=None, text="Library Cleared")
         self.change_view("home")
 
@@ -371,11 +581,52 @@ class ProImageStudio(ctk.CTk):
 
     def run_pipeline_export(self):
         if not self.selected_files: return
+        if self.export_job and self.export_job.is_running(): return
         save_dir = filedialog.askdirectory()
         if save_dir:
-            count = self.processor.run_full_export(self.selected_files, save_dir, self.settings)
-            messagebox.showinfo("Done", f"Exported {count} images!")
-            self.change_view("history")
+            files = list(self.selected_files)
+            if self.skip_near_duplicates: files = [p for p in files if p not in self.near_duplicates]
+            self.export_status = None
+            self.export_job = self.processor.start_export(
+                files, save_dir, dict(self.settings),
+                workers=None, progress_cb=self.export_updates.put
+            )
+            self.btn_start_export.configure(state="disabled", text="Processing...")
+            self.export_panel.pack(fill="x")
+            self.export_panel.update_progress(0, "Starting...")
+            self.after(100, self.poll_export)
+
+    def poll_export(self):
+        # Progress snapshots arrive from the export thread; only the latest matters
+        try:
+            while True: self.export_status = self.export_updates.get_nowait()
+        except queue.Empty:
+            pass
+        if self.export_status: self.show_export_progress(self.export_status)
+
+        if self.export_job.is_running():
+            self.after(100, self.poll_export)
+            return
+
+        job = self.export_job
+        if job.error:
+            messagebox.showerror("Export Failed", str(job.error))
+        elif job.cancelled:
+            messagebox.showinfo("Cancelled", f"Export cancelled after {job.result} images.")
+        else:
+            messagebox.showinfo("Done", f"Exported {job.result} images!")
+        self.change_view("history")
+
+    def show_export_progress(self, status):
+        if not (self.export_panel and self.export_panel.winfo_exists()): return
+        total = status['files_total'] or 0
+        text = f"{status['files_done']} / {total}  •  {status['files_per_sec']:.1f} img/s  •  {status['bytes_written'] / 1e6:.1f} MB"
+        if status['eta'] is not None: text += f"  •  ETA {int(status['eta'])}s"
+        if status['current_file']: text += f"\n{os.path.basename(status['current_file'])}"
+        self.export_panel.update_progress(status['files_done'] / max(1, total), text)
+
+    def cancel_export(self):
+        if self.export_job: self.export_job.cancel()
 
 if __name__ == "__main__":
     app = ProImageStudio()
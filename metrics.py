@@ -0,0 +1,105 @@
+"""
+Lightweight pipeline instrumentation.
+
+Metrics collects per-stage timers and counters (images, pixels, bytes,
+cache hits, errors). When disabled, stage() hands back a shared no-op
+context manager and count() returns immediately, so instrumented code
+costs almost nothing. An optional profiler_hook(stage, seconds) is called
+after every timed stage, e.g. to feed an external profiler or tracer.
+"""
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+class _NullStage:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Failures are counted by whoever handles them (errors.<what>), not here as well
+        self.metrics.add_time(self.name, time.perf_counter() - self.started)
+        return False
+
+class Metrics:
+    def __init__(self, enabled=True, sample_memory=False, profiler_hook=None):
+        self.enabled = enabled
+        self.sample_memory = sample_memory and resource is not None
+        self.profiler_hook = profiler_hook
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stages = {}      # name -> [calls, total_seconds, max_seconds]
+            self.counters = {}
+            self.peak_rss_mb = None
+            self.started = time.perf_counter()
+
+    def stage(self, name):
+        if not self.enabled: return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if self.sample_memory:
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, rss)
+        if self.profiler_hook: self.profiler_hook(name, seconds)
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # --- Aggregation (process-pool workers send raw() back to the parent) ---
+
+    def raw(self):
+        with self._lock:
+            return {"stages": {k: list(v) for k, v in self.stages.items()},
+                    "counters": dict(self.counters), "peak_rss_mb": self.peak_rss_mb}
+
+    def merge(self, raw):
+        if not raw or not self.enabled: return
+        with self._lock:
+            for name, (calls, total, longest) in raw["stages"].items():
+                entry = self.stages.setdefault(name, [0, 0.0, 0.0])
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], longest)
+            for name, n in raw["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            if raw.get("peak_rss_mb"):
+                self.peak_rss_mb = max(self.peak_rss_mb or 0, raw["peak_rss_mb"])
+
+    def summary(self):
+        """JSON-friendly per-run summary."""
+        with self._lock:
+            stages = {
+                name: {"calls": calls, "total_s": round(total, 4),
+                       "mean_ms": round(total / calls * 1000, 3) if calls else 0.0,
+                       "max_ms": round(longest * 1000, 3)}
+                for name, (calls, total, longest) in self.stages.items()
+            }
+            return {"wall_s": round(time.perf_counter() - self.started, 4), "stages": stages,
+                    "counters": dict(self.counters), "peak_rss_mb": self.peak_rss_mb}
@@ -1,4 +1,7 @@
 import customtkinter as ctk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import queue
 from PIL import Image
 import os  # لفتح الفولدرات
 from tkinter import messagebox
@@ -48,6 +51,7 @@ class GalleryItem(ctk.CTkFrame):
         self.file_path = file_path
         self.pack_propagate(False)
 
+        # Commands read self.file_path so a slot can be re-bound to another file
         self.image_btn = ctk.CTkButton(
             self, 
             text="", 
@@ -56,7 +60,7 @@ class GalleryItem(ctk.CTkFrame):
             corner_radius=10,
             border_width=0,
             hover_color=COLOR_ACCENT,
-            command=lambda: select_command(file_path)
+            command=lambda: select_command(self.file_path)
         )
         self.image_btn.pack(fill="both", expand=True, padx=3, pady=3)
 
@@ -70,16 +74,258 @@ class GalleryItem(ctk.CTkFrame):
             text_color="white",
             font=("Arial", 14, "bold"),
             corner_radius=11,
-            command=lambda: delete_command(self, file_path)
+            command=lambda: delete_command(self, self.file_path)
         )
         self.del_btn.place(relx=0.85, rely=0.05, anchor="n")
 
+    def bind_item(self, file_path, thumb_image, selected=False):
+        if file_path != self.file_path or self.image_btn.cget("image") is not thumb_image:
+            self.file_path = file_path
+            self.image_btn.configure(image=thumb_image, text="" if thumb_image else "...")
+        self.set_selected(selected)
+
     def set_selected(self, selected):
         if selected:
             self.image_btn.configure(border_width=2, border_color=COLOR_ACCENT)
         else:
             self.image_btn.configure(border_width=0)
 
+class VirtualFilmstrip(ctk.CTkFrame):
+    """
+    Horizontal filmstrip that only creates widgets for what is on screen.
+    A small pool of GalleryItem slots is re-bound to the visible window as the
+    user scrolls; thumbnails are requested lazily through thumb_loader(path)
+    and handed back with set_thumbnail(). Only the most recent max_thumbs
+    thumbnails are kept in memory.
+    """
+    def __init__(self, master, select_command, delete_command, thumb_loader, item_width=120, max_thumbs=400):
+        super().__init__(master, height=130, fg_color="transparent")
+        self.select_command = select_command
+        self.delete_command = delete_command
+        self.thumb_loader = thumb_loader
+        self.item_width = item_width
+        self.max_thumbs = max_thumbs
+
+        self.paths = []
+        self.thumbs = OrderedDict()
+        self.requested = set()
+        self.selected_path = None
+        self.offset = 0
+        self.slots = []
+        self.visible = {}
+
+        self.strip = ctk.CTkFrame(self, height=112, fg_color="transparent")
+        self.strip.pack(fill="x", expand=True)
+        self.scrollbar = ctk.CTkScrollbar(self, orientation="horizontal", command=self.on_scrollbar)
+        self.scrollbar.pack(fill="x")
+
+        self.strip.bind("<Configure>", lambda e: self.render())
+        for seq in ("<MouseWheel>", "<Shift-MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.strip.bind(seq, self.on_wheel)
+
+    # --- Data ---
+    def add_item(self, path, thumb=None):
+        self.paths.append(path)
+        if thumb is not None: self._store_thumb(path, thumb)
+        self.render()
+
+    def remove_item(self, path):
+        if path in self.paths: self.paths.remove(path)
+        self.thumbs.pop(path, None)
+        self.requested.discard(path)
+        if path == self.selected_path: self.selected_path = None
+        self.render()
+
+    def clear(self):
+        self.paths.clear()
+        self.thumbs.clear()
+        self.requested.clear()
+        self.selected_path = None
+        self.offset = 0
+        self.render()
+
+    def set_thumbnail(self, path, thumb):
+        self.requested.discard(path)
+        if thumb is None: return
+        self._store_thumb(path, thumb)
+        slot = self.visible.get(path)
+        if slot: slot.bind_item(path, self.thumbs[path], path == self.selected_path)
+
+    def set_selected(self, path):
+        # Only the slots showing the old and new selection are touched
+        old_slot = self.visible.get(self.selected_path)
+        if old_slot: old_slot.set_selected(False)
+        self.selected_path = path
+        new_slot = self.visible.get(path)
+        if new_slot: new_slot.set_selected(True)
+
+    def _store_thumb(self, path, thumb):
+        self.thumbs[path] = ctk.CTkImage(thumb, size=thumb.size)
+        self.thumbs.move_to_end(path)
+        while len(self.thumbs) > self.max_thumbs:
+            self.thumbs.popitem(last=False)
+
+    # --- Scrolling ---
+    def max_offset(self):
+        return max(0, len(self.paths) * self.item_width - self.strip.winfo_width())
+
+    def scroll_to(self, offset):
+        self.offset = max(0, min(self.max_offset(), int(offset)))
+        self.render()
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.scroll_to(float(args[1]) * len(self.paths) * self.item_width)
+        elif args[0] == "scroll":
+            step = self.strip.winfo_width() if args[2] == "pages" else self.item_width
+            self.scroll_to(self.offset + int(args[1]) * step)
+
+    def on_wheel(self, event):
+        if getattr(event, "num", None) == 4 or getattr(event, "delta", 0) > 0:
+            self.scroll_to(self.offset - self.item_width)
+        else:
+            self.scroll_to(self.offset + self.item_width)
+
+    # --- Rendering ---
+    def render(self):
+        width = max(1, self.strip.winfo_width())
+        needed = width // self.item_width + 2
+        while len(self.slots) < needed:
+            slot = GalleryItem(self.strip, None, None, self.select_command, self.delete_command)
+            for seq in ("<MouseWheel>", "<Shift-MouseWheel>", "<Button-4>", "<Button-5>"):
+                slot.image_btn.bind(seq, self.on_wheel)
+            self.slots.append(slot)
+
+        self.offset = max(0, min(self.max_offset(), self.offset))
+        first = self.offset // self.item_width
+        self.visible = {}
+        for k, slot in enumerate(self.slots):
+            idx = first + k
+            if k >= needed or idx >= len(self.paths):
+                slot.place_forget()
+                continue
+            path = self.paths[idx]
+            thumb = self.thumbs.get(path)
+            if thumb is None:
+                if path not in self.requested:
+                    self.requested.add(path)
+                    self.thumb_loader(path)
+            else:
+                self.thumbs.move_to_end(path)
+            slot.bind_item(path, thumb, path == self.selected_path)
+            slot.place(x=idx * self.item_width - self.offset + 5, y=0)
+            self.visible[path] = slot
+
+        total = len(self.paths) * self.item_width
+        if total <= width:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + width) / total)
+
+class ProgressPanel(ctk.CTkFrame):
+    """
+    Compact progress card: status text, progress bar and a Cancel button.
+    """
+    def __init__(self, master, cancel_command=None):
+        super().__init__(master, fg_color=COLOR_CARD, corner_radius=10)
+
+        self.status_lbl = ctk.CTkLabel(self, text="", font=("Segoe UI", 12), text_color=COLOR_TEXT, anchor="w")
+        self.status_lbl.pack(fill="x", padx=12, pady=(8, 2))
+
+        bottom = ctk.CTkFrame(self, fg_color="transparent")
+        bottom.pack(fill="x", padx=12, pady=(0, 8))
+
+        self.cancel_btn = ctk.CTkButton(
+            bottom,
+            text="Cancel",
+            width=70,
+            height=24,
+            fg_color="transparent",
+            border_width=1,
+            border_color=COLOR_DANGER,
+            text_color=COLOR_DANGER,
+            hover_color="#300000",
+            command=cancel_command
+        )
+        self.cancel_btn.pack(side="right", padx=(10, 0))
+
+        self.bar = ctk.CTkProgressBar(bottom, progress_color=COLOR_ACCENT)
+        self.bar.pack(side="left", fill="x", expand=True)
+        self.bar.set(0)
+
+    def update_progress(self, fraction, text):
+        self.bar.set(max(0.0, min(1.0, fraction)))
+        self.status_lbl.configure(text=text)
+
+class PreviewScheduler:
+    """
+    Coalesces bursts of preview requests (slider ticks, drag events) into
+    renders of the latest state. At most one render runs at a time on a
+    background thread; requests arriving meanwhile collapse into a single
+    follow-up render, so latency stays around two render times however fast
+    events come in. Results older than the last shown one, or requested
+    before invalidate(), are dropped.
+
+    snapshot_fn() runs on the Tk thread and captures the render inputs,
+    render_fn(job) runs on the worker, apply_fn(result) runs on the Tk thread.
+    """
+    def __init__(self, widget, snapshot_fn, render_fn, apply_fn, delay_ms=15):
+        self.widget = widget
+        self.snapshot_fn = snapshot_fn
+        self.render_fn = render_fn
+        self.apply_fn = apply_fn
+        self.delay_ms = delay_ms
+        self.generation = 0
+        self.shown_generation = 0
+        self.scheduled = False
+        self.busy = False
+        self.dirty = False
+        self.results = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def request(self):
+        self.generation += 1
+        if self.busy:
+            self.dirty = True
+        elif not self.scheduled:
+            self.scheduled = True
+            self.widget.after(self.delay_ms, self._dispatch)
+
+    def invalidate(self):
+        """Drops whatever is in flight (e.g. the image was removed)."""
+        self.generation += 1
+        self.shown_generation = self.generation
+        self.dirty = False
+
+    def _dispatch(self):
+        self.scheduled = False
+        self.dirty = False
+        job = self.snapshot_fn()
+        if job is None: return
+        self.busy = True
+        self.executor.submit(self._run, self.generation, job)
+        self.widget.after(self.delay_ms, self._poll)
+
+    def _run(self, generation, job):
+        try:
+            result = self.render_fn(job)
+        except Exception as e:
+            print(f"Preview render failed: {e}")
+            result = None
+        self.results.put((generation, result))
+
+    def _poll(self):
+        try:
+            generation, result = self.results.get_nowait()
+        except queue.Empty:
+            self.widget.after(self.delay_ms, self._poll)
+            return
+        self.busy = False
+        if generation > self.shown_generation and result is not None:
+            self.shown_generation = generation
+            self.apply_fn(result)
+        if self.dirty: self._dispatch()
+
 class HistoryRow(ctk.CTkFrame):
     """
     Advanced History Row: Shows Op, Date, Path, and Open Button.
@@ -130,6 +376,15 @@ class HistoryRow(ctk.CTkFrame):
         
         ctk.CTkLabel(content_frame, text=f"Saved to: {display_path}", font=("Consolas", 11), text_color=COLOR_TEXT_DIM, anchor="w").pack(fill="x")
 
+        # Run metrics (exports recorded with instrumentation on)
+        details = entry.get('details')
+        if details and details.get('wall_s'):
+            stages = details.get('stages', {})
+            slowest = max(stages, key=lambda k: stages[k]['total_s']) if stages else None
+            text = f"{details['wall_s']:.1f}s · {entry.get('count', 0) / details['wall_s']:.1f} img/s"
+            if slowest: text += f" · slowest stage: {slowest}"
+            ctk.CTkLabel(content_frame, text=text, font=("Consolas", 10), text_color=COLOR_TEXT_DIM, anchor="w").pack(fill="x")
+
 
     def open_folder_safely(self):
         """
@@ -0,0 +1,263 @@
+"""
+Shared work queue for multi-node exports.
+
+A coordinator (ImageProcessor.run_distributed_export) submits one item per
+source file; any number of workers, on this host or others, claim items
+under a lease, export them and report the result. A worker that dies stops
+renewing its lease and the item is handed to someone else once the lease
+runs out (up to max_attempts times).
+
+Backends are duck-typed; a queue needs submit, claim, renew, complete,
+release, finished, counts, pending and cancel with the signatures of
+SQLiteWorkQueue, plus start_local_worker for coordinators that start
+workers on their own host (local_workers). The SQLite backend runs on one box as is; for several hosts put the database
+on a shared filesystem with working POSIX locks (e.g. NFSv4, SMB). It uses
+SQLite's rollback journal rather than WAL, which needs shared memory on a
+single host and breaks over network filesystems. Sources and save_dir must
+resolve to the same paths on every node.
+
+    python work_queue.py queue.db            # run a worker until stopped
+    python work_queue.py queue.db --idle-exit
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from export_journal import encode_outputs
+
+class SQLiteWorkQueue:
+    def __init__(self, db_path, max_attempts=3):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        with self._connect() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    save_dir TEXT, settings TEXT, created REAL, status TEXT
+                )""")
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, job INTEGER, source TEXT,
+                    status TEXT, worker TEXT, lease_until REAL, attempts INTEGER DEFAULT 0,
+                    output TEXT, error TEXT, seconds REAL, metrics TEXT, seq INTEGER
+                )""")
+            db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS items_job_seq ON items (job, seq)")
+
+    def _connect(self):
+        # One connection per call: workers renew leases from a heartbeat thread.
+        # Rollback journal, not WAL: the file may be shared between hosts (see module docstring)
+        db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=DELETE")
+        return db
+
+    def submit(self, sources, save_dir, settings):
+        """Creates a job with one item per source; returns the job id."""
+        with self._connect() as db:
+            db.execute("BEGIN IMMEDIATE")
+            job = db.execute(
+                "INSERT INTO jobs (save_dir, settings, created, status) VALUES (?, ?, ?, 'active')",
+                (os.path.abspath(save_dir), json.dumps(settings), time.time())
+            ).lastrowid
+            db.executemany(
+                "INSERT INTO items (job, source, status) VALUES (?, ?, 'queued')",
+                ((job, os.path.abspath(source)) for source in sources)
+            )
+            db.execute("COMMIT")
+        return job
+
+    def claim(self, worker_id, lease_seconds=300):
+        """
+        Leases the oldest queued (or lease-expired) item to worker_id.
+        Returns {'id', 'job', 'source', 'save_dir', 'settings'} or None when nothing is claimable.
+        """
+        db = self._connect()
+        try:
+            while True:
+                now = time.time()
+                db.execute("BEGIN IMMEDIATE")
+                row = db.execute(
+                    "SELECT id, job, source, attempts FROM items "
+                    "WHERE status='queued' OR (status='leased' AND lease_until < ?) ORDER BY id LIMIT 1",
+                    (now,)
+                ).fetchone()
+                if row is None:
+                    db.execute("COMMIT")
+                    return None
+                item_id, job, source, attempts = row
+                if attempts >= self.max_attempts:
+                    # Every lease so far expired: most likely the file kills its worker
+                    self._finish(db, item_id, job, "failed", None, "lease expired too many times", None, None)
+                    db.execute("COMMIT")
+                    continue
+                db.execute(
+                    "UPDATE items SET status='leased', worker=?, lease_until=?, attempts=attempts+1 WHERE id=?",
+                    (worker_id, now + lease_seconds, item_id)
+                )
+                save_dir, settings = db.execute("SELECT save_dir, settings FROM jobs WHERE id=?", (job,)).fetchone()
+                db.execute("COMMIT")
+                return {'id': item_id, 'job': job, 'source': source, 'save_dir': save_dir, 'settings': json.loads(settings)}
+        finally:
+            db.close()
+
+    def renew(self, item_id, worker_id, lease_seconds=300):
+        """Extends a lease; False when the item was requeued to another worker meanwhile."""
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE items SET lease_until=? WHERE id=? AND worker=? AND status='leased'",
+                (time.time() + lease_seconds, item_id, worker_id)
+            )
+            return cur.rowcount == 1
+
+    def complete(self, item_id, worker_id, output=None, error=None, seconds=None, metrics=None):
+        """Stores a result. Ignored (returns False) if the lease was lost to another worker."""
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT job FROM items WHERE id=? AND worker=? AND status='leased'", (item_id, worker_id)
+            ).fetchone()
+            if row:
+                output = encode_outputs(output)
+                self._finish(db, item_id, row[0], "done" if output else "failed", output, error, seconds, metrics)
+            db.execute("COMMIT")
+            return row is not None
+        finally:
+            db.close()
+
+    def release(self, worker_id):
+        """
+        Requeues everything leased by worker_id right away, for workers known to
+        be dead (e.g. a local worker process that exited). Returns the count.
+        attempts is kept, so a file that keeps killing workers still ends up failed.
+        """
+        with self._connect() as db:
+            return db.execute(
+                "UPDATE items SET status='queued', worker=NULL, lease_until=NULL WHERE worker=? AND status='leased'",
+                (worker_id,)
+            ).rowcount
+
+    def _finish(self, db, item_id, job, status, output, error, seconds, metrics):
+        # seq orders completions per job so the coordinator can read them incrementally
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM items WHERE job=?", (job,)).fetchone()[0]
+        db.execute(
+            "UPDATE items SET status=?, output=?, error=?, seconds=?, metrics=?, seq=?, lease_until=NULL WHERE id=?",
+            (status, output, error, seconds, json.dumps(metrics) if metrics else None, seq, item_id)
+        )
+
+    def finished(self, job, after_seq=0):
+        """Completed items of job with seq > after_seq, in completion order."""
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT seq, source, status, output, error, seconds, metrics FROM items "
+                "WHERE job=? AND seq > ? ORDER BY seq", (job, after_seq)
+            ).fetchall()
+        return [
+            {'seq': r[0], 'source': r[1], 'status': r[2], 'output': r[3], 'error': r[4],
+             'seconds': r[5], 'metrics': json.loads(r[6]) if r[6] else None}
+            for r in rows
+        ]
+
+    def counts(self, job):
+        """{status: n} for job (queued / leased / done / failed / cancelled)."""
+        with self._connect() as db:
+            return dict(db.execute("SELECT status, COUNT(*) FROM items WHERE job=? GROUP BY status", (job,)).fetchall())
+
+    def pending(self):
+        """Items of any job that are queued or leased (i.e. not finished yet)."""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*) FROM items WHERE status IN ('queued', 'leased')").fetchone()[0]
+
+    def start_local_worker(self, options, worker_id):
+        """Starts a worker process on this host (ImageProcessor options, see _local_worker); returns it."""
+        worker = multiprocessing.Process(target=_local_worker, args=(self.db_path, options, worker_id), daemon=True)
+        worker.start()
+        return worker
+
+    def cancel(self, job):
+        """Drops the job's queued items; leased ones still finish."""
+        with self._connect() as db:
+            db.execute("UPDATE items SET status='cancelled' WHERE job=? AND status='queued'", (job,))
+            db.execute("UPDATE jobs SET status='cancelled' WHERE id=?", (job,))
+
+def run_worker(queue, processor, worker_id=None, lease_seconds=300, poll_interval=1.0, stop_event=None, idle_exit=False):
+    """
+    Claims and exports items until stop_event is set (or, with idle_exit,
+    until no item is queued or leased). Idle workers keep polling while other
+    workers hold leases, so they can take over an item whose worker died once
+    its lease runs out. A heartbeat thread renews the lease while an item is
+    being exported. Returns the number of items this worker exported.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    stop_event = stop_event or threading.Event()
+    metrics = processor.metrics
+    count = 0
+    while not stop_event.is_set():
+        item = queue.claim(worker_id, lease_seconds)
+        if item is None:
+            if idle_exit and not queue.pending(): break
+            stop_event.wait(poll_interval)
+            continue
+
+        done = threading.Event()
+        threading.Thread(target=_heartbeat, args=(queue, item['id'], worker_id, lease_seconds, done), daemon=True).start()
+
+        metrics.reset()
+        started = time.perf_counter()
+        try:
+            saved, error = processor.export_file(item['source'], item['save_dir'], item['settings']), None
+        except Exception as e:
+            print(f"Error saving {item['source']}: {e}")
+            saved, error = None, str(e)
+        done.set()
+        if queue.complete(item['id'], worker_id, saved, error, time.perf_counter() - started,
+                          metrics.raw() if metrics.enabled else None) and saved:
+            count += 1
+    return count
+
+def _heartbeat(queue, item_id, worker_id, lease_seconds, done):
+    while not done.wait(lease_seconds / 3):
+        if not queue.renew(item_id, worker_id, lease_seconds): return
+
+def local_worker_id(n):
+    return f"{socket.gethostname()}:{os.getpid()}:local{n}:{uuid.uuid4().hex[:6]}"
+
+def _local_worker(db_path, options, worker_id, idle_exit=True):
+    """multiprocessing target for run_distributed_export(local_workers=N)."""
+    from image_core import ImageProcessor
+    processor = ImageProcessor(track_history=False, thumb_db=None, **options)
+    run_worker(SQLiteWorkQueue(db_path), processor, worker_id=worker_id, idle_exit=idle_exit)
+
+def main(argv=None):
+    from image_core import ImageProcessor
+
+    parser = argparse.ArgumentParser(description="Image Studio Pro export worker")
+    parser.add_argument("queue", help="SQLite work queue database (shared with the coordinator)")
+    parser.add_argument("--lease", type=float, default=300, help="Seconds before an unrenewed item is handed to another worker")
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between claims while the queue is empty")
+    parser.add_argument("--idle-exit", action="store_true", help="Exit once the queue is empty")
+    parser.add_argument("--max-pixels", type=int, help="Allow inputs up to this many pixels (Pillow's bomb limit)")
+    parser.add_argument("--max-image-mb", type=int, default=2048, help="Per-image decoded memory ceiling")
+    parser.add_argument("--metrics", action="store_true", help="Report per-stage timings to the coordinator")
+    args = parser.parse_args(argv)
+
+    processor = ImageProcessor(
+        track_history=False, thumb_db=None, instrument=args.metrics,
+        max_image_bytes=args.max_image_mb * 1024 * 1024, max_image_pixels=args.max_pixels
+    )
+    try:
+        count = run_worker(SQLiteWorkQueue(args.queue), processor, lease_seconds=args.lease,
+                           poll_interval=args.poll, idle_exit=args.idle_exit)
+    except KeyboardInterrupt:
+        return 0
+    print(f"Exported {count} images")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())